@@ -0,0 +1,203 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# local stand-in for the drive v3 endpoints this project uses, so the hot
+# paths can be benchmarked offline. file bodies are generated, not stored.
+#
+#   python bench/fake_drive.py --port 8001 --latency 40 --error-rate 0.01
+#   DRIVE_API_URL=http://127.0.0.1:8001/drive/v3/ ROOT_FOLDER_ID=root ...
+
+import asyncio
+import json
+import random
+import re
+from argparse import ArgumentParser
+from hashlib import md5
+
+from aiohttp import web
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+BLOCK = random.Random(0).randbytes(1024 * 1024)
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+
+
+def build_tree(folders, files_per_folder, big_files, big_size):
+    # root -> `folders` sub folders -> `files_per_folder` small files each,
+    # plus a few big videos in root for streaming scenarios
+    rng = random.Random(1)
+    files = {"root": {"id": "root", "name": "root", "mimeType": FOLDER_MIME_TYPE, "parents": []}}
+
+    def add(file_id, name, mime_type, parent, size=None):
+        item = {"id": file_id, "name": name, "mimeType": mime_type, "parents": [parent], "modifiedTime": "2025-01-01T00:00:00.000Z"}
+        if size is not None:
+            item["size"] = str(size)
+            item["md5Checksum"] = md5(f"{file_id}:{size}".encode()).hexdigest()
+        files[file_id] = item
+
+    for i in range(big_files):
+        add(f"video{i}", f"{rng.choice(WORDS)} movie {i}.mkv", "video/x-matroska", "root", big_size)
+    for f in range(folders):
+        folder_id = f"folder{f}"
+        add(folder_id, f"{rng.choice(WORDS)} folder {f}", FOLDER_MIME_TYPE, "root")
+        for i in range(files_per_folder):
+            add(f"{folder_id}file{i}", f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}.mp4", "video/mp4", folder_id, rng.randint(1024, 50 * 1024 * 1024))
+    return files
+
+
+class FakeDrive:
+    def __init__(self, files, latency=0.0, error_rate=0.0, quota_rate=0.0):
+        self.files = files
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.children = {}
+        for item in files.values():
+            for parent in item["parents"]:
+                self.children.setdefault(parent, []).append(item)
+        for items in self.children.values():
+            items.sort(key=lambda i: (i["mimeType"] != FOLDER_MIME_TYPE, i["name"]))
+        self.calls = {}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/drive/v3/files", self.files_list)
+        app.router.add_get("/drive/v3/files/{file_id}", self.files_get)
+        app.router.add_get("/drive/v3/changes/startPageToken", self.start_page_token)
+        app.router.add_get("/drive/v3/changes", self.changes_list)
+        app.router.add_get("/_stats", self.stats)
+        return app
+
+    async def __delay(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    def __injected_error(self, media=False):
+        if random.random() < self.error_rate:
+            return web.json_response(
+                {"error": {"code": 503, "message": "Backend Error", "errors": [{"reason": "backendError"}]}},
+                status=503,
+            )
+        if media and random.random() < self.quota_rate:
+            return web.json_response(
+                {"error": {"code": 403, "message": "quota", "errors": [{"reason": "downloadQuotaExceeded"}]}},
+                status=403,
+            )
+        return None
+
+    @staticmethod
+    def __not_found(file_id):
+        return web.json_response(
+            {"error": {"code": 404, "message": f"File not found: {file_id}.", "errors": [{"reason": "notFound"}]}},
+            status=404,
+        )
+
+    async def files_get(self, request):
+        file_id = request.match_info["file_id"]
+        media = request.query.get("alt") == "media"
+        await self.__delay("get_media" if media else "files.get")
+        error = self.__injected_error(media)
+        if error:
+            return error
+        item = self.files.get(file_id)
+        if item is None:
+            return self.__not_found(file_id)
+        if not media:
+            return web.json_response(item)
+        return await self.__media(request, item)
+
+    async def __media(self, request, item):
+        size = int(item.get("size", 0))
+        start, end, status = 0, size - 1, 200
+        match = re.match(r"bytes=(\d*)-(\d*)", request.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1) or 0)
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            status = 206
+            if start >= size:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+
+        response = web.StreamResponse(status=status)
+        response.content_length = end - start + 1
+        response.content_type = item["mimeType"]
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        await response.prepare(request)
+
+        # deterministic body: byte i of a file is BLOCK[i % len(BLOCK)]
+        offset = start
+        while offset <= end:
+            block_offset = offset % len(BLOCK)
+            piece = BLOCK[block_offset:block_offset + min(256 * 1024, end - offset + 1)]
+            await response.write(piece)
+            offset += len(piece)
+        await response.write_eof()
+        return response
+
+    async def files_list(self, request):
+        await self.__delay("files.list")
+        error = self.__injected_error()
+        if error:
+            return error
+        q = request.query.get("q", "")
+        page_size = int(request.query.get("pageSize", 100))
+        offset = int(request.query.get("pageToken") or 0)
+
+        parent = re.search(r"'([^']+)' in parents", q)
+        if parent:
+            items = self.children.get(parent.group(1), [])
+        else:
+            words = [w.lower() for w in re.findall(r"name contains '([^']*)'", q)]
+            items = [
+                i for i in self.files.values()
+                if i["id"] != "root" and all(w in i["name"].lower() for w in words)
+            ]
+
+        page = items[offset:offset + page_size]
+        body = {"files": page}
+        if offset + page_size < len(items):
+            body["nextPageToken"] = str(offset + page_size)
+        return web.json_response(body)
+
+    async def start_page_token(self, request):
+        await self.__delay("changes.getStartPageToken")
+        return web.json_response({"startPageToken": "1"})
+
+    async def changes_list(self, request):
+        await self.__delay("changes.list")
+        return web.json_response({"newStartPageToken": "1", "changes": []})
+
+    async def stats(self, request):
+        return web.json_response(self.calls)
+
+
+def make_drive(args):
+    return FakeDrive(
+        build_tree(args.folders, args.files_per_folder, args.big_files, args.big_size * 1024 * 1024),
+        latency=args.latency / 1000,
+        error_rate=args.error_rate,
+        quota_rate=args.quota_rate,
+    )
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=30, help="mean per call latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with 503")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="fraction of media calls failing with downloadQuotaExceeded")
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--files-per-folder", type=int, default=500)
+    parser.add_argument("--big-files", type=int, default=4)
+    parser.add_argument("--big-size", type=int, default=512, help="size of each big file in MB")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Fake Google Drive v3 server")
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps({"listening": f"http://127.0.0.1:{args.port}/drive/v3/"}))
+    web.run_app(make_drive(args).app(), host="127.0.0.1", port=args.port, print=None)
@@ -0,0 +1,249 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# offline benchmark: boots bench/fake_drive.py and the app (uvicorn, one
+# worker) against it, then reports throughput, ttfb and memory per stream
+#
+#   python bench/run.py                          # every scenario
+#   python bench/run.py range_seeks flash_crowd --concurrency 100 --latency 80
+#   python bench/run.py --env CACHE_SIZE=0 --env STREAM_BACKEND=httplib2
+
+import asyncio
+import json
+import random
+import sys
+from argparse import ArgumentParser
+from os import environ, path as ospath
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+from time import monotonic
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from fake_drive import WORDS, add_arguments, make_drive
+
+ROOT = ospath.dirname(ospath.dirname(ospath.abspath(__file__)))
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+class Sampler:
+    # tracks the app's peak rss while a scenario runs
+    def __init__(self, pid):
+        self.pid = pid
+        self.baseline = rss_bytes(pid)
+        self.peak = self.baseline
+        self.__task = None
+
+    async def __loop(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes(self.pid))
+            await asyncio.sleep(0.05)
+
+    def __enter__(self):
+        self.__task = asyncio.ensure_future(self.__loop())
+        return self
+
+    def __exit__(self, *_):
+        self.__task.cancel()
+
+
+async def timed_get(session, url, headers=None):
+    started = monotonic()
+    ttfb, received = None, 0
+    async with session.get(url, headers=headers or {}) as resp:
+        async for data in resp.content.iter_any():
+            if ttfb is None:
+                ttfb = monotonic() - started
+            received += len(data)
+        status = resp.status
+    elapsed = monotonic() - started
+    return {"status": status, "ttfb": ttfb if ttfb is not None else elapsed, "bytes": received, "elapsed": elapsed}
+
+
+async def range_seeks(session, base, args):
+    size = args.big_size * 1024 * 1024
+    window = args.seek_window * 1024
+
+    async def _worker():
+        samples = []
+        for _ in range(args.requests):
+            start = random.randrange(size - window)
+            samples.append(
+                await timed_get(session, f"{base}/dl/video0", {"Range": f"bytes={start}-{start + window - 1}"})
+            )
+        return samples
+
+    return sum(await asyncio.gather(*[_worker() for _ in range(args.concurrency)]), [])
+
+
+async def flash_crowd(session, base, args):
+    # everybody starts the same file at once
+    end = args.crowd_size * 1024 * 1024 - 1
+    return await asyncio.gather(
+        *[timed_get(session, f"{base}/dl/video1", {"Range": f"bytes=0-{end}"}) for _ in range(args.concurrency)]
+    )
+
+
+async def folder_listing(session, base, args):
+    async def _walk(folder_id):
+        samples, page_token = [], None
+        while True:
+            url = f"{base}/folders/list?folder_id={folder_id}&page_size=100"
+            if page_token:
+                url += f"&page_token={page_token}"
+            started = monotonic()
+            async with session.get(url) as resp:
+                body = await resp.read()
+                status = resp.status
+            elapsed = monotonic() - started
+            samples.append({"status": status, "ttfb": elapsed, "bytes": len(body), "elapsed": elapsed})
+            if status != 200:
+                break
+            page_token = json.loads(body).get("additional_info", {}).get("page_token")
+            if not page_token:
+                break
+        return samples
+
+    folders = [f"folder{i % args.folders}" for i in range(args.concurrency)]
+    return sum(await asyncio.gather(*[_walk(f) for f in folders]), [])
+
+
+async def search(session, base, args):
+    async def _worker():
+        samples = []
+        for _ in range(args.requests):
+            query = " ".join(random.sample(WORDS, 2))
+            samples.append(await timed_get(session, f"{base}/search?query={query}"))
+        return samples
+
+    return sum(await asyncio.gather(*[_worker() for _ in range(args.concurrency)]), [])
+
+
+SCENARIOS = {
+    "range_seeks": (range_seeks, True),
+    "flash_crowd": (flash_crowd, True),
+    "folder_listing": (folder_listing, False),
+    "search": (search, False),
+}
+
+
+def summarize(name, samples, elapsed, sampler, streaming, concurrency):
+    ok = [s for s in samples if s["status"] in [200, 206]]
+    ttfbs = sorted(s["ttfb"] * 1000 for s in ok)
+    cuts = quantiles(ttfbs, n=100) if len(ttfbs) > 1 else ttfbs * 99
+    report = {
+        "scenario": name,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "req_per_s": round(len(samples) / elapsed, 1),
+        "mb_per_s": round(sum(s["bytes"] for s in ok) / elapsed / 1024 / 1024, 1),
+        "ttfb_p50_ms": round(cuts[49], 1) if cuts else None,
+        "ttfb_p99_ms": round(cuts[98], 1) if cuts else None,
+        "peak_rss_mb": round(sampler.peak / 1024 / 1024, 1),
+    }
+    if streaming:
+        report["rss_per_stream_kb"] = round((sampler.peak - sampler.baseline) / concurrency / 1024, 1)
+    return report
+
+
+async def wait_for_app(session, base, process):
+    for _ in range(300):
+        if process.returncode is not None:
+            raise SystemExit("app exited before becoming ready")
+        try:
+            async with session.get(f"{base}/stats") as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+    raise SystemExit("app did not become ready")
+
+
+async def main(args):
+    drive = make_drive(args)
+    runner = web.AppRunner(drive.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.drive_port).start()
+
+    with TemporaryDirectory() as workdir:
+        env = {
+            **environ,
+            "ROOT_FOLDER_ID": "root",
+            "DRIVE_API_URL": f"http://127.0.0.1:{args.drive_port}/drive/v3/",
+            "IS_SERVICE_ACCOUNT": "False",
+            "CACHE_DIR": ospath.join(workdir, "cache"),
+            "INDEX_PATH": ospath.join(workdir, "index.db"),
+            "SHARED_CACHE_PATH": ospath.join(workdir, "cache.db"),
+            "SEARCH_INDEX": "False",
+        }
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        env.update(dict(e.split("=", 1) for e in args.env))
+
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(args.app_port), "--log-level", "warning",
+            cwd=ROOT,
+            env=env,
+        )
+        base = f"http://127.0.0.1:{args.app_port}"
+        reports = []
+        try:
+            async with ClientSession(
+                connector=TCPConnector(limit=0), timeout=ClientTimeout(total=None)
+            ) as session:
+                await wait_for_app(session, base, process)
+                for name in args.scenarios:
+                    scenario, streaming = SCENARIOS[name]
+                    with Sampler(process.pid) as sampler:
+                        started = monotonic()
+                        samples = await scenario(session, base, args)
+                        elapsed = monotonic() - started
+                    reports.append(summarize(name, samples, elapsed, sampler, streaming, args.concurrency))
+                reports.append({"scenario": "drive_calls", **drive.calls})
+        finally:
+            process.terminate()
+            await process.wait()
+            await runner.cleanup()
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for report in reports:
+        print(report.pop("scenario"))
+        for key, value in report.items():
+            print(f"  {key:<22}{value}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the mirror against a fake drive")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default all)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="requests per worker for looping scenarios")
+    parser.add_argument("--seek-window", type=int, default=512, help="KB fetched by each range seek")
+    parser.add_argument("--crowd-size", type=int, default=64, help="MB each flash crowd client downloads")
+    parser.add_argument("--app-port", type=int, default=8000)
+    parser.add_argument("--drive-port", type=int, default=8001)
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app")
+    parser.add_argument("--json", action="store_true")
+    add_arguments(parser)
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    asyncio.run(main(args))
@@ -10,22 +10,35 @@
 # only base (like login & sa management)
 # everything else written by me@kaif-00z under AGPLv3 license
 
+from collections import deque
+from contextlib import aclosing
 from logging import getLogger, ERROR
-from pickle import load as pload
-from os import path as ospath, listdir
-from io import BytesIO
-from random import randrange
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from time import time, perf_counter
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
 
 from .utils import (
     hbs,
     run_async,
-    asyncio
+    ChunkSizer,
+    content_version,
+    is_media,
+    asyncio,
+    LANES,
 )
 from .config import Var
+from .accounts import AccountPool
+from .archive import FolderArchive
+from .cache import TTLCache, SingleFlight, NegativeEntry, MISSING
+from .fanout import FanOut
+from .index import SearchIndex
+from .listing import FolderListings
+from .matrices import ChunkCache
+from .popularity import Popularity, WarmUp
+from .shared import SharedCache
+from .metrics import DRIVE_LATENCY, RETRIES, QUOTA_SWITCHES
+from .resilience import Resilience, backoff, error_reason, is_retryable, retry_label
+from .tracing import record, span
+from .transport import AsyncMediaTransport
 
 LOGGER = getLogger(__name__)
 getLogger("googleapiclient.discovery").setLevel(ERROR)
@@ -33,142 +46,595 @@ getLogger("googleapiclient.discovery").setLevel(ERROR)
 
 class GoogleDriver:
     def __init__(self):
-        self.__OAUTH_SCOPE = ["https://www.googleapis.com/auth/drive"]
         self.__G_DRIVE_DIR_MIME_TYPE = "application/vnd.google-apps.folder"
-        self.__sa_index = 0
-        self.__sa_count = 1
-        self.__sa_number = 100
-        self.__service = self.__authorize()
-
-    def __authorize(self):
-        credentials = None
-        if Var.IS_SERVICE_ACCOUNT:
-            json_files = listdir("accounts")
-            self.__sa_number = len(json_files)
-            self.__sa_index = randrange(self.__sa_number)
-            LOGGER.info(
-                f"Authorizing with {json_files[self.__sa_index]} service account"
-            )
-            credentials = service_account.Credentials.from_service_account_file(
-                f"accounts/{json_files[self.__sa_index]}", scopes=self.__OAUTH_SCOPE
+        self.__accounts = AccountPool()
+        self.__resilience = Resilience()
+        self.__transport = AsyncMediaTransport()
+        self.__cache = ChunkCache()
+        self.__shared = SharedCache()
+        self.__meta_cache = TTLCache(Var.META_CACHE_SIZE, Var.META_CACHE_TTL, name="metadata")
+        self.__meta_flight = SingleFlight()
+        self.__shortcut_cache = TTLCache(Var.META_CACHE_SIZE, Var.SHORTCUT_CACHE_TTL, name="shortcuts")
+        self.__fanout = FanOut(self.__download, Var.FANOUT_BUFFER * 1024 * 1024)
+        self.__index = SearchIndex(self.__files_list, self.__changes_list, self.__changes_start_token)
+        self.__listings = FolderListings(self.__files_list, self.__resolve_shortcuts, self.__shared)
+        self.__archive = FolderArchive(self.iter_folder, self.stream_file)
+        self.__popularity = Popularity()
+        self.__warmup = WarmUp(
+            self.__popularity, self.__shared, self.__warm_metadata, self.__warm_listing, self.__warm_head, self.__busy
+        )
+        self.__tasks = []
+        self.__prefetching = set()
+        self.__warming = set()
+        self.__prefetch_limiter = asyncio.Semaphore(max(Var.MEDIA_PREFETCH_CONCURRENCY, 1))
+
+    # every metadata call goes through Resilience: retried with backoff, hedged
+    # past its p95 and failing fast while drive is degraded
+
+    def __getFileMetadata(self, file_id):
+        return self.__resilience.call("files.get", self.__get_file_metadata, file_id)
+
+    @run_async
+    def __get_file_metadata(self, file_id):
+        with self.__accounts.client() as (service, http), DRIVE_LATENCY.labels("files.get").time():
+            return (
+                service.files()
+                .get(
+                    fileId=file_id,
+                    supportsAllDrives=True,
+                    fields="name, id, mimeType, size, md5Checksum, modifiedTime, version",
+                )
+                .execute(http=http)
             )
-        elif ospath.exists("token.pickle"):
-            LOGGER.info("Authorize with token.pickle")
-            with open("token.pickle", "rb") as f:
-                credentials = pload(f)
-        else:
-            LOGGER.error("token.pickle not found nor service accounts if any!")
-        return build("drive", "v3", credentials=credentials, cache_discovery=False)
 
 
+    def __batchGetFileMetadata(self, file_ids):
+        return self.__resilience.call("batch", self.__batch_get_file_metadata, file_ids)
+
     @run_async
-    def __switchServiceAccount(self):
-        if self.__sa_index == self.__sa_number - 1:
-            self.__sa_index = 0
-        else:
-            self.__sa_index += 1
-        self.__sa_count += 1
-        LOGGER.info(f"Switching to {self.__sa_index} index")
-        self.__service = self.__authorize()
+    def __batch_get_file_metadata(self, file_ids):
+        results, errors = {}, []
+
+        def _callback(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                results[request_id] = None
+            else:
+                errors.append(exception)
+
+        with self.__accounts.client() as (service, http):
+            batch = service.new_batch_http_request(callback=_callback)
+            for file_id in file_ids:
+                batch.add(
+                    service.files().get(
+                        fileId=file_id,
+                        supportsAllDrives=True,
+                        fields="name, id, mimeType, size, md5Checksum, modifiedTime, version",
+                    ),
+                    request_id=file_id,
+                )
+            with DRIVE_LATENCY.labels("batch").time():
+                batch.execute(http=http)
+        if errors:
+            raise errors[0]
+        return results
+
+    async def __resolve_shortcuts(self, files):
+        # one batch request per 100 shortcut targets instead of a call each
+        target_ids = {
+            f["shortcutDetails"]["targetId"]
+            for f in files
+            if f.get("shortcutDetails", {}).get("targetId")
+        }
+        targets, missing = {}, []
+        for target_id in target_ids:
+            cached = self.__shortcut_cache.get(target_id)
+            if cached is MISSING:
+                missing.append(target_id)
+            else:
+                targets[target_id] = cached
+
+        for i in range(0, len(missing), 100):
+            for target_id, meta in (await self.__batchGetFileMetadata(missing[i:i + 100])).items():
+                self.__shortcut_cache.set(
+                    target_id, meta, ttl=None if meta else Var.NEGATIVE_CACHE_TTL
+                )
+                targets[target_id] = meta
+        return targets
+
+    def __files_list(self, **params):
+        return self.__resilience.call("files.list", self.__files_list_once, **params)
 
     @run_async
-    def __getFileMetadata(self, file_id):
-        return (
-            self.__service.files()
-            .get(
+    def __files_list_once(self, **params):
+        with self.__accounts.client() as (service, http), DRIVE_LATENCY.labels("files.list").time():
+            return service.files().list(**params).execute(http=http)
+
+    def __changes_list(self, **params):
+        return self.__resilience.call("changes.list", self.__changes_list_once, **params)
+
+    @run_async
+    def __changes_list_once(self, **params):
+        with self.__accounts.client() as (service, http), DRIVE_LATENCY.labels("changes.list").time():
+            return service.changes().list(**params).execute(http=http)
+
+    def __changes_start_token(self):
+        return self.__resilience.call("changes.getStartPageToken", self.__changes_start_token_once)
+
+    @run_async
+    def __changes_start_token_once(self):
+        with self.__accounts.client() as (service, http), DRIVE_LATENCY.labels("changes.getStartPageToken").time():
+            return service.changes().getStartPageToken(
+                supportsAllDrives=True
+            ).execute(http=http)["startPageToken"]
+
+    async def __httplib2_stream(self, account, file_id, start, end, sizer):
+
+        @run_async
+        def _create_request():
+            return account.service.files().get_media(
                 fileId=file_id,
-                supportsAllDrives=True,
-                fields="name, id, mimeType, size",
+                supportsAllDrives=True
             )
-            .execute()
+        
+        @run_async(lane="media")
+        def _get_range(req, offset, length):
+            # ask drive for only the window we need instead of the whole file
+            with account.http() as http, DRIVE_LATENCY.labels("get_media").time():
+                resp, content = http.request(
+                    req.uri,
+                    method="GET",
+                    headers={**req.headers, "range": f"bytes={offset}-{offset + length - 1}"},
+                )
+            if resp.status not in [200, 206]:
+                raise HttpError(resp, content, uri=req.uri)
+            return resp, content
+
+        request = await _create_request()
+        offset = start
+
+        while end is None or offset <= end:
+            length = sizer.take(None if end is None else end - offset + 1)
+            resp, chunk_data = await _get_range(request, offset, length)
+            if not chunk_data:
+                break
+
+            yield chunk_data
+            offset += len(chunk_data)
+
+            if len(chunk_data) < length:
+                # short read, we hit the end of the file
+                break
+            if end is None:
+                total = resp.get("content-range", "").rpartition("/")[2]
+                if total.isdigit():
+                    end = int(total) - 1
+
+    def __open_stream(self, account, file_id, start, end, sizer):
+        if Var.STREAM_BACKEND == "httplib2":
+            return self.__httplib2_stream(account, file_id, start, end, sizer)
+        # the body arrives as the socket delivers it, never a whole chunk at once
+        return self.__transport.stream(
+            account.credentials, file_id, start, end, read_size=min(sizer.maximum, Var.NET_CHUNK_SIZE * 1024)
         )
 
+    async def __fetch(self, file_id, start, end, sizer):
+        offset = start
+        retries = 0
+        exhausted = set()
+        failed = False
+        account = self.__accounts.acquire(download=file_id)
+
+        try:
+            while end is None or offset <= end:
+                opened = False
+                try:
+                    # the first piece is raced against a hedge past get_media's p95
+                    stream, first = await self.__resilience.open_stream(
+                        "get_media",
+                        lambda: self.__open_stream(account, file_id, offset, end, sizer),
+                        retry=retries > 0,
+                    )
+                    opened = True
+                    async with aclosing(stream):
+                        if first is not None:
+                            yield first
+                            offset += len(first)
+                            retries = 0
+                        waited = perf_counter()
+                        async for chunk_data in stream:
+                            # time spent waiting on drive for the body, not on the client
+                            record("get_media-read", perf_counter() - waited)
+                            yield chunk_data
+                            offset += len(chunk_data)
+                            retries = 0
+                            waited = perf_counter()
+                    break
+
+                except Exception as err:
+                    if opened:
+                        # broke mid body, open_stream only saw the start go fine
+                        self.__resilience.record("get_media", err, retry=retries > 0)
+
+                    if is_retryable(err) and retries < Var.RETRY_LIMIT:
+                        RETRIES.labels(retry_label(err)).inc()
+                        await asyncio.sleep(backoff(retries))
+                        retries += 1
+                        continue
+
+                    reason = error_reason(err)
+                    if reason in ["downloadQuotaExceeded", "dailyLimitExceeded"]:
+                        self.__accounts.mark_exhausted(account, reason, file_id)
+                        exhausted.add(account)
+                        self.__accounts.release(account, failed=True)
+                        account = None
+                        account = self.__accounts.acquire(exclude=exhausted, download=file_id)
+                        QUOTA_SWITCHES.inc()
+                        # resume from the last byte we sent, client already has the rest
+                        LOGGER.info(f"Got {reason}, resuming {file_id} at byte {offset} with {account.name}")
+                        continue
+
+                    LOGGER.error(f"Streaming error: {str(err)}")
+                    raise err
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if account is not None:
+                self.__accounts.release(account, failed)
+
+    async def __segmented_download(self, file_id, start, end):
+        segment_size = Var.SEGMENT_SIZE * 1024 * 1024
+        window = max(Var.READ_AHEAD_SEGMENTS, Var.PARALLEL_SEGMENTS)
+        limiter = asyncio.Semaphore(Var.PARALLEL_SEGMENTS)
+        pending = deque()
+        head = None
+        next_start = start
+
+        async def _fetch_segment(seg_start, seg_end, queue):
+            async with limiter:
+                try:
+                    segment = self.__fetch(file_id, seg_start, seg_end, ChunkSizer(segment_size))
+                    async with aclosing(segment):
+                        async for piece in segment:
+                            queue.put_nowait(piece)
+                    queue.put_nowait(None)
+                except Exception as err:
+                    queue.put_nowait(err)
+
+        try:
+            while pending or next_start <= end:
+                # keep at most `window` segments in flight or buffered
+                while next_start <= end and len(pending) < window:
+                    seg_end = min(next_start + segment_size - 1, end)
+                    queue = asyncio.Queue()
+                    pending.append(
+                        (asyncio.ensure_future(_fetch_segment(next_start, seg_end, queue)), queue)
+                    )
+                    next_start = seg_end + 1
+
+                # the head segment streams as it arrives, the rest buffer behind it
+                head, queue = pending.popleft()
+                while True:
+                    piece = await queue.get()
+                    if piece is None:
+                        break
+                    if isinstance(piece, Exception):
+                        raise piece
+                    yield piece
+                head = None
+        finally:
+            # the head segment too, it's still downloading if the client left mid way
+            tasks = [task for task, _ in pending] + ([head] if head is not None else [])
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __download(self, file_id, start, end, sizer=None):
+        if (
+            Var.PARALLEL_SEGMENTS > 1
+            and end is not None
+            and end - start + 1 > Var.SEGMENT_SIZE * 1024 * 1024
+        ):
+            return self.__segmented_download(file_id, start, end)
+        return self.__fetch(file_id, start, end, sizer or ChunkSizer(Var.SERVER_SIDE_SPEED * 1024 * 1024))
+
+    def __upstream(self, file_id, start, end, version, size, sizer=None):
+        # concurrent readers of the same revision share a single drive download,
+        # which sizes its own chunks since no one client sets its pace
+        if self.__fanout.enabled and size:
+            return self.__fanout.stream(file_id, version, start, end)
+        return self.__download(file_id, start, end, sizer)
+
+    async def __cached_stream(self, file_id, start, end, version, size, sizer):
+        cache_chunk = self.__cache.chunk_size
+        index, last = start // cache_chunk, end // cache_chunk
+        # one staging buffer per stream, reused for every chunk we cache
+        buffer = None
+
+        while index <= last:
+            data = self.__cache.get(file_id, version, index)
+            if data is not None:
+                base = index * cache_chunk
+                yield data[max(start - base, 0):end - base + 1]
+                index += 1
+                continue
+
+            # fetch the whole run of missing chunks with one ranged request
+            run_end = index
+            while run_end < last and not self.__cache.has(file_id, version, run_end + 1):
+                run_end += 1
+
+            if end - start + 1 < cache_chunk and end < size - 1:
+                # a probe (player sniffing headers, a seek), fetch only its bytes
+                # instead of making it wait for whole cache chunks or a shared
+                # download running to the end of the file
+                upstream = self.__download(
+                    file_id, max(start, index * cache_chunk), min(end, (run_end + 1) * cache_chunk - 1), sizer
+                )
+                async with aclosing(upstream):
+                    async for piece in upstream:
+                        yield piece
+                index = run_end + 1
+                continue
+
+            offset = index * cache_chunk
+            fetch_end = min((run_end + 1) * cache_chunk, size) - 1
+            if buffer is None:
+                buffer = bytearray(cache_chunk)
+            filled = 0
+
+            upstream = self.__upstream(file_id, offset, fetch_end, version, size, sizer)
+            async with aclosing(upstream):
+                async for piece in upstream:
+                    view = memoryview(piece)
+                    while view:
+                        chunk_index = offset // cache_chunk
+                        chunk_stop = min((chunk_index + 1) * cache_chunk, size)
+                        part = view[:chunk_stop - offset]
+
+                        lo, hi = max(start, offset), min(end, offset + len(part) - 1)
+                        if lo <= hi:
+                            yield part[lo - offset:hi - offset + 1]
+
+                        buffer[filled:filled + len(part)] = part
+                        filled += len(part)
+                        offset += len(part)
+                        view = view[len(part):]
+
+                        if offset == chunk_stop:
+                            # awaited, so the buffer is free again once this returns
+                            await self.__cache.put(file_id, version, chunk_index, memoryview(buffer)[:filled])
+                            filled = 0
+
+            index = run_end + 1
+
+    def __missing_chunks(self, file_id, version, size, first, last):
+        # chunks [first, last] neither cached nor being fetched, claimed for the caller
+        last = min(last, (size - 1) // self.__cache.chunk_size)
+        keys = [
+            (file_id, version, index)
+            for index in range(max(first, 0), last + 1)
+            if (file_id, version, index) not in self.__warming
+            and not self.__cache.has(file_id, version, index)
+        ]
+        self.__warming.update(keys)
+        return keys
+
+    def __prefetch(self, file_id, version, size, first, last):
+        # fill cache chunks [first, last] in the background, skipping the ones
+        # already cached or being fetched
+        if not (self.__cache.enabled and version and size):
+            return
+        if len(self.__prefetching) >= max(Var.MEDIA_PREFETCH_CONCURRENCY, 1):
+            # every slot is busy, dropping it beats an unbounded queue of
+            # downloads no one may ever ask for
+            return
+        keys = self.__missing_chunks(file_id, version, size, first, last)
+        if not keys:
+            return
+        task = asyncio.ensure_future(self.__warm(file_id, version, size, keys))
+        self.__prefetching.add(task)
+        task.add_done_callback(self.__prefetching.discard)
+
+    async def __warm(self, file_id, version, size, keys):
+        cache_chunk = self.__cache.chunk_size
+        start, end = keys[0][2] * cache_chunk, min((keys[-1][2] + 1) * cache_chunk, size) - 1
+        try:
+            async with self.__prefetch_limiter:
+                stream = self.__cached_stream(
+                    file_id, start, end, version, size, ChunkSizer(Var.SERVER_SIDE_SPEED * 1024 * 1024)
+                )
+                async with aclosing(stream):
+                    async for _ in stream:
+                        pass
+        except Exception as err:
+            LOGGER.warning(f"Prefetch of {file_id} bytes {start}-{end} failed: {err}")
+        finally:
+            self.__warming.difference_update(keys)
+
+    def prefetch_media(self, info):
+        # players read the head, jump to the tail for the index, then seek, so
+        # have both ends on disk before they ask. only for downloads, browsing
+        # a folder of videos shouldn't pull every one of them
+        size, cache_chunk = info["size"], self.__cache.chunk_size
+        if not is_media(info.get("mime_type")) or not size:
+            return
+        version = content_version(info)
+        if Var.MEDIA_PREFETCH_HEAD > 0:
+            head = Var.MEDIA_PREFETCH_HEAD * 1024 * 1024
+            self.__prefetch(info["id"], version, size, 0, (min(head, size) - 1) // cache_chunk)
+        if Var.MEDIA_PREFETCH_TAIL > 0:
+            tail = Var.MEDIA_PREFETCH_TAIL * 1024 * 1024
+            self.__prefetch(info["id"], version, size, max(size - tail, 0) // cache_chunk, (size - 1) // cache_chunk)
+
+    # warm-up work for the most requested ids, each reports what it cost
+    # upstream so WarmUp can keep within its budget
+
+    async def __warm_metadata(self, file_id):
+        info = self.__meta_cache.peek(file_id)
+        if isinstance(info, NegativeEntry):
+            raise info.error
+        if info is not MISSING:
+            return info, 0
+        return await self.__meta_flight.do(file_id, self.__load_file_info, file_id), 1
+
+    async def __warm_listing(self, folder_id):
+        if not self.__listings.enabled or self.__listings.has(folder_id):
+            return 0
+        entry = await self.__listings.get(folder_id)
+        return (len(entry["items"]) - 1) // 1000 + 1 if entry["items"] else 1
+
+    async def __warm_head(self, info, budget):
+        size, version, cache_chunk = info["size"], content_version(info), self.__cache.chunk_size
+        nbytes = min(Var.WARMUP_HEAD * 1024 * 1024, budget, size or 0)
+        if not (self.__cache.enabled and version and nbytes > 0):
+            return 0
+        keys = self.__missing_chunks(info["id"], version, size, 0, (nbytes - 1) // cache_chunk)
+        if not keys:
+            return 0
+        await self.__warm(info["id"], version, size, keys)
+        return min((keys[-1][2] + 1) * cache_chunk, size) - keys[0][2] * cache_chunk
+
+    def __busy(self):
+        # live requests queueing for threads or every prefetch slot taken
+        return any(lane.pending for lane in LANES.values()) or self.__prefetch_limiter.locked()
+
+    def check_download(self, file_id):
+        self.__accounts.check_download(file_id)
+
+    def record_access(self, item_id, kind):
+        if item_id:
+            self.__popularity.hit(item_id.strip(), kind)
+
     async def stream_file(
         self,
         file_id,
+        start=0,
+        end=None,
+        version=None,
+        size=None,
         chunk_size=Var.SERVER_SIDE_SPEED * 1024 * 1024,
+        read_ahead=False,
     ):
-        
         file_id = file_id.strip()
+        sizer = ChunkSizer(chunk_size)
+
+        if read_ahead and Var.MEDIA_READ_AHEAD > 0 and size and end is not None and end < size - 1:
+            # the next request after a seek usually picks up where this ends
+            first = (end + 1) // self.__cache.chunk_size
+            self.__prefetch(file_id, version, size, first, first + Var.MEDIA_READ_AHEAD - 1)
+
+        # chunks are only reusable when we know which revision they belong to
+        if self.__cache.enabled and version and size and end is not None:
+            stream = self.__cached_stream(file_id, start, end, version, size, sizer)
+        elif end is not None:
+            stream = self.__upstream(file_id, start, end, version, size, sizer)
+        else:
+            stream = self.__download(file_id, start, end, sizer)
+
+        net_chunk = Var.NET_CHUNK_SIZE * 1024
+        async with aclosing(stream):
+            async for chunk_data in stream:
+                # network sized views, nothing is copied and the next upstream
+                # read only happens once a slow client has taken these
+                view = memoryview(chunk_data)
+                for i in range(0, len(view), net_chunk):
+                    piece = view[i:i + net_chunk]
+                    yield piece
+                    sizer.drained(len(piece))
+
+    def cache_stats(self):
+        return {
+            "chunks": self.__cache.stats(),
+            "metadata": self.__meta_cache.stats(),
+            "shortcuts": self.__shortcut_cache.stats(),
+            "listings": self.__listings.stats(),
+            "shared": self.__shared.stats(),
+            "fanout": self.__fanout.stats(),
+            "prefetching": len(self.__prefetching),
+        }
 
-        @run_async
-        def _create_request():
-            return self.__service.files().get_media(
-                fileId=file_id,
-                supportsAllDrives=True
-            )
-        
-        @run_async
-        def _get_next_chunk(ddl):
-            return ddl.next_chunk()
-        
-        request = await _create_request()
-        buffer = BytesIO()
-        downloader = MediaIoBaseDownload(buffer, request, chunksize=chunk_size)
-        
-        done = False
-        retries = 0
+    def account_stats(self):
+        return self.__accounts.stats()
 
-        while not done:
-            try:
-                
-                status, done = await _get_next_chunk(downloader)
-                
-                buffer.seek(0)
+    def drive_stats(self):
+        return self.__resilience.stats()
 
-                chunk_data = buffer.read()
-                yield chunk_data
+    def warmup_stats(self):
+        return self.__warmup.stats()
 
-                buffer.seek(0)
-                buffer.truncate()
-                retries = 0
+    def start(self):
+        # background jobs, started from the app lifespan inside each worker
+        if self.__index.enabled:
+            self.__tasks.append(asyncio.ensure_future(self.__index.run()))
+        if self.__warmup.enabled:
+            self.__tasks.append(asyncio.ensure_future(self.__warmup.run()))
+
+    async def close(self):
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        for task in list(self.__prefetching):
+            task.cancel()
+        await asyncio.gather(*self.__prefetching, return_exceptions=True)
+        await self.__listings.close()
+        await self.__transport.close()
 
-            except HttpError as err:
-                if err.resp.status in [500, 502, 503, 504] and retries < 10:
-                    retries += 1
-                    await asyncio.sleep(2)
-                    continue
-                
-                if err.resp.get("content-type", "").startswith("application/json"):
-                    try:
-                        error_data = eval(err.content)
-                        reason = error_data.get("error", {}).get("errors", [{}])[0].get("reason")
-                        if reason in ["downloadQuotaExceeded", "dailyLimitExceeded"]:
-                            if self.__sa_count < self.__sa_number:
-                                LOGGER.info(f"Got {reason}, switching service account...")
-                                await self.__switchServiceAccount()
-                                # restart the entire stream?
-                                async for chunk in self.stream_file(file_id):
-                                    yield chunk
-                            else:
-                                raise Exception(f"All service accounts quota exceeded: {reason}")
-                    except Exception as er:
-                        raise er
-                else: raise err
-            
-            except Exception as err:
-                LOGGER.error(f"Streaming error: {str(err)}")
-                raise err
 
+    async def __fetch_file_info(self, file_id):
+        try:
+            meta = await self.__getFileMetadata(file_id)
+        except HttpError as err:
+            if err.resp.status == 404:
+                self.__meta_cache.set(file_id, NegativeEntry(err), ttl=Var.NEGATIVE_CACHE_TTL)
+            raise err
+
+        info = {
+            "name": meta["name"],
+            "id": meta["id"],
+            "mime_type": meta.get("mimeType"),
+            "size": int(meta.get("size", 0)),
+            "type": "folder" if meta.get("mimeType") == self.__G_DRIVE_DIR_MIME_TYPE else "file",
+            "md5_checksum": meta.get("md5Checksum"),
+            "modified_time": meta.get("modifiedTime"),
+            "version": meta.get("version"),
+        }
+        self.__meta_cache.set(file_id, info)
+        await self.__shared.set("metadata", file_id, info, Var.META_CACHE_TTL)
+        return info
+
+    async def __load_file_info(self, file_id):
+        # another worker may already know it, keep only what's left of its ttl
+        cached = await self.__shared.get("metadata", file_id)
+        if cached is not MISSING:
+            info, expires_at = cached
+            self.__meta_cache.set(file_id, info, ttl=expires_at - time())
+            return info
+        return await self.__fetch_file_info(file_id)
 
     async def get_file_info(self, file_id) -> dict:
         try:
             file_id = file_id.strip()
-            
-            meta = await self.__getFileMetadata(file_id)
 
-            return {
-                "name": meta["name"],
-                "id": meta["id"],
-                "mime_type": meta.get("mimeType"),
-                "size": int(meta.get("size", 0)),
-                "type": "folder" if meta.get("mimeType") == self.__G_DRIVE_DIR_MIME_TYPE else "file"
-            }
+            info = self.__meta_cache.get(file_id)
+            if info is MISSING:
+                with span("metadata-miss"):
+                    info = await self.__meta_flight.do(file_id, self.__load_file_info, file_id)
+            elif isinstance(info, NegativeEntry):
+                raise info.error
+
+            return dict(info)
         except Exception as err:
             LOGGER.error(f"Error getting file info: {str(err)}")
             raise err
 
-    async def list_all(self, folder_id: str = Var.ROOT_FOLDER_ID, page_token: str = None, page_size: int = 100):
+    async def list_all(self, folder_id: str = Var.ROOT_FOLDER_ID, page_token: str = None, page_size: int = 100, cached: bool = True):
+        if cached and self.__listings.enabled and self.__listings.owns(page_token):
+            with span("listing"):
+                return await self.__listings.page(folder_id, page_token, page_size)
+
         all_items = []
         info = {
             "total_files": 0,
@@ -177,23 +643,19 @@ class GoogleDriver:
             "page_token": None
         }
 
-        async def _process_file_batch(files: list):
-            tasks = [_process_single_file(file) for file in files]
+        async def _process_file_batch(files: list, targets: dict):
+            tasks = [_process_single_file(file, targets) for file in files]
             await asyncio.gather(*tasks)
 
-        async def _process_single_file(file: dict):
+        async def _process_single_file(file: dict, targets: dict):
             try:
                 shortcut = file.get("shortcutDetails")
                 if shortcut:
                     target_id = shortcut.get("targetId")
-                    try:
-                        file = await self.__getFileMetadata(target_id)
-                    except HttpError as err:
-                        if err.resp.status == 404:
-                            LOGGER.warning(f"Shortcut target not found: {target_id}")
-                            return
-                        else:
-                            raise
+                    file = targets.get(target_id)
+                    if not file:
+                        LOGGER.warning(f"Shortcut target not found: {target_id}")
+                        return
                 
                 name = file.get("name")
                 mime_type = file.get("mimeType")
@@ -211,8 +673,11 @@ class GoogleDriver:
                     "name": name,
                     "mime_type": mime_type,
                     "size": hbs(size),
+                    "bytes": size,
                     "parent_folder_id": folder_id,
                     "type": item_type,
+                    "md5_checksum": file.get("md5Checksum"),
+                    "modified_time": file.get("modifiedTime"),
                 }
 
                 if item_type == "folder":
@@ -233,12 +698,14 @@ class GoogleDriver:
                 files = response.get("files", [])
                 if not files:
                     return
+
+                targets = await self.__resolve_shortcuts(files)
                 
                 # Process files in parallel batches
                 batch_size = 50
                 for i in range(0, len(files), batch_size):
                     batch = files[i:i + batch_size]
-                    await _process_file_batch(batch)    
+                    await _process_file_batch(batch, targets)    
 
                 info["page_token"] = response.get("nextPageToken")
                 
@@ -252,10 +719,9 @@ class GoogleDriver:
                 LOGGER.error(f"Error listing folder {folder_id}: {e}")
                 raise e
 
-        @run_async
-        def _execute_files_list():
+        async def _execute_files_list():
             try:
-                return self.__service.files().list(
+                return await self.__files_list(
                     supportsAllDrives=True,
                     includeItemsFromAllDrives=True,
                     q=f"'{folder_id}' in parents and trashed = false",
@@ -263,11 +729,11 @@ class GoogleDriver:
                     pageSize=page_size,
                     fields=(
                         "nextPageToken, "
-                        "files(id, name, mimeType, size, shortcutDetails)"
+                        "files(id, name, mimeType, size, md5Checksum, modifiedTime, shortcutDetails)"
                     ),
                     orderBy="folder, name",
                     pageToken=page_token,
-                ).execute()
+                )
             except Exception as err:
                 raise err
 
@@ -282,10 +748,15 @@ class GoogleDriver:
             "total_files_size": 0,
             "page_token": None
         }
+
+        # answered from the local index once it's built, drive is only the fallback
+        if (not page_token or page_token.isdigit()) and await self.__index.is_ready():
+            with span("search-index"):
+                return await self.__index.search(query.strip(), int(page_token or 0), page_size)
+
         query = query.strip().replace("'", "\\'")
 
-        @run_async
-        def _execute_search():
+        async def _execute_search():
             if not query:
                 return all_items, info
 
@@ -316,27 +787,23 @@ class GoogleDriver:
                 params["pageToken"] = page_token
 
             try:
-                return self.__service.files().list(**params).execute()
+                return await self.__files_list(**params)
             except Exception as err:
                 raise err
         
-        async def _process_file_batch(files: list):
-            tasks = [_process_single_file(file) for file in files]
+        async def _process_file_batch(files: list, targets: dict):
+            tasks = [_process_single_file(file, targets) for file in files]
             await asyncio.gather(*tasks)
 
-        async def _process_single_file(file: dict):
+        async def _process_single_file(file: dict, targets: dict):
             try:
                 shortcut = file.get("shortcutDetails")
                 if shortcut:
                     target_id = shortcut.get("targetId")
-                    try:
-                        file = await self.__getFileMetadata(target_id)
-                    except HttpError as err:
-                        if err.resp.status == 404:
-                            LOGGER.warning(f"Shortcut target not found: {target_id}")
-                            return
-                        else:
-                            raise
+                    file = targets.get(target_id)
+                    if not file:
+                        LOGGER.warning(f"Shortcut target not found: {target_id}")
+                        return
                 
                 name = file.get("name")
                 mime_type = file.get("mimeType")
@@ -373,12 +840,14 @@ class GoogleDriver:
                 files = response.get("files", [])
                 if not files:
                     return
+
+                targets = await self.__resolve_shortcuts(files)
                 
                 # Process files in parallel batches
                 batch_size = 50
                 for i in range(0, len(files), batch_size):
                     batch = files[i:i + batch_size]
-                    await _process_file_batch(batch)    
+                    await _process_file_batch(batch, targets)    
 
                 info["page_token"] = response.get("nextPageToken")
             except HttpError as err:
@@ -389,4 +858,24 @@ class GoogleDriver:
                 raise e
         
         await _list_()
-        return all_items, info
\ No newline at end of file
+        return all_items, info
+
+    async def __walk(self, fetch_page, *args, **kwargs):
+        page_token = None
+        while True:
+            items, info = await fetch_page(*args, page_token=page_token, page_size=1000, **kwargs)
+            yield items, info
+            page_token = info["page_token"]
+            if not page_token:
+                break
+
+    def iter_folder(self, folder_id: str = Var.ROOT_FOLDER_ID):
+        # a cached listing is replayed straight away, otherwise drive's pages
+        # are relayed as they land instead of waiting for the whole folder
+        return self.__walk(self.list_all, folder_id, cached=self.__listings.has(folder_id))
+
+    def iter_search(self, query: str):
+        return self.__walk(self.search_files_in_drive, query)
+
+    def zip_folder(self, folder_id: str):
+        return self.__archive.stream(folder_id)
@@ -0,0 +1,254 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# pool of drive accounts, each with its own service & quota bookkeeping
+
+import json
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from math import ceil
+from logging import getLogger
+from os import path as ospath, listdir
+from pickle import load as pload
+from random import randrange
+from threading import BoundedSemaphore, Lock, RLock
+from time import monotonic
+
+import httplib2
+from google.auth.credentials import AnonymousCredentials
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from .config import Var
+
+LOGGER = getLogger(__name__)
+
+OAUTH_SCOPE = ["https://www.googleapis.com/auth/drive"]
+
+
+@lru_cache(maxsize=1)
+def drive_document():
+    # googleapiclient ships drive v3's discovery doc, read & parsed once per
+    # worker and shared by every account instead of once per build()
+    document = get_static_doc("drive", "v3")
+    if document is None:
+        LOGGER.warning("Bundled drive v3 discovery document not found, falling back to build()")
+        return None
+    return json.loads(document)
+
+
+class Account:
+    def __init__(self, name, loader):
+        self.name = name
+        self.__loader = loader
+        self.__credentials = None
+        self.__service = None
+        # reentrant, building the service loads the credentials under it too
+        self.__lock = RLock()
+        # httplib2 isn't thread-safe, every call checks out its own connection
+        self.__idle = deque()
+        self.__slots = BoundedSemaphore(Var.DRIVE_CLIENTS)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.quota_hits = 0
+        # downloads only, metadata & listings never count against these
+        self.exhausted_until = 0.0
+        # file_id -> until, drive's downloadQuotaExceeded is per file
+        self.__exhausted_files = {}
+
+    @property
+    def credentials(self):
+        if self.__credentials is None:
+            with self.__lock:
+                if self.__credentials is None:
+                    self.__credentials = self.__loader()
+        return self.__credentials
+
+    @property
+    def service(self):
+        # built on first use, most of 100 accounts may never be needed
+        if self.__service is None:
+            with self.__lock:
+                if self.__service is None:
+                    LOGGER.info(f"Authorizing with {self.name}")
+                    document = drive_document()
+                    if document is not None:
+                        self.__service = build_from_document(
+                            document,
+                            credentials=self.credentials,
+                            client_options={"api_endpoint": Var.DRIVE_API_URL},
+                        )
+                    else:
+                        self.__service = build(
+                            "drive",
+                            "v3",
+                            credentials=self.credentials,
+                            cache_discovery=False,
+                            client_options={"api_endpoint": Var.DRIVE_API_URL},
+                        )
+        return self.__service
+
+    @contextmanager
+    def http(self):
+        self.__slots.acquire()
+        try:
+            try:
+                http = self.__idle.pop()
+            except IndexError:
+                http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=60))
+            try:
+                yield http
+            except Exception:
+                # the connection may be half read, don't hand it out again
+                http = None
+                raise
+            finally:
+                if http is not None:
+                    self.__idle.append(http)
+        finally:
+            self.__slots.release()
+
+    def can_download(self, file_id=None):
+        now = monotonic()
+        if now < self.exhausted_until:
+            return False
+        return file_id is None or self.__exhausted_files.get(file_id, 0.0) <= now
+
+    def rested_for(self, file_id=None):
+        # seconds until can_download(file_id) holds again
+        until = max(self.exhausted_until, self.__exhausted_files.get(file_id, 0.0) if file_id else 0.0)
+        return max(until - monotonic(), 0.0)
+
+    def rest_file(self, file_id, until):
+        now = monotonic()
+        self.__exhausted_files = {f: t for f, t in self.__exhausted_files.items() if t > now}
+        self.__exhausted_files[file_id] = until
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "idle_connections": len(self.__idle),
+            "requests": self.requests,
+            "errors": self.errors,
+            "quota_hits": self.quota_hits,
+            "exhausted_for": max(round(self.exhausted_until - monotonic()), 0),
+            "exhausted_files": sum(t > monotonic() for t in self.__exhausted_files.values()),
+        }
+
+
+class AllAccountsExhausted(Exception):
+    # like CircuitOpen, tells the client when it's worth coming back
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"All service accounts quota exceeded, retry in {retry_after}s")
+
+
+class AccountPool:
+    def __init__(self, strategy=Var.SA_STRATEGY):
+        self.strategy = strategy
+        self.__lock = Lock()
+        self.__accounts = self.__load_accounts()
+        self.__cursor = randrange(len(self.__accounts))
+
+    def __load_accounts(self):
+        if Var.IS_SERVICE_ACCOUNT:
+            return [
+                Account(
+                    json_file,
+                    lambda f=json_file: service_account.Credentials.from_service_account_file(
+                        f"accounts/{f}", scopes=OAUTH_SCOPE
+                    ),
+                )
+                for json_file in sorted(listdir("accounts"))
+                if json_file.endswith(".json")
+            ]
+        if ospath.exists("token.pickle"):
+            def _load_token():
+                with open("token.pickle", "rb") as f:
+                    return pload(f)
+            return [Account("token.pickle", _load_token)]
+        LOGGER.error("token.pickle not found nor service accounts if any!")
+        # unauthenticated, only useful against a local fake drive (see bench/)
+        return [Account("anonymous", AnonymousCredentials)]
+
+    def __len__(self):
+        return len(self.__accounts)
+
+    def acquire(self, exclude=(), download=None):
+        # download: the file_id about to be downloaded, quota only applies then
+        with self.__lock:
+            # rotate the starting point so ties don't always land on one account
+            self.__cursor = (self.__cursor + 1) % len(self.__accounts)
+            order = self.__accounts[self.__cursor:] + self.__accounts[:self.__cursor]
+            candidates = [
+                a for a in order
+                if a not in exclude and (download is None or a.can_download(download))
+            ]
+            if not candidates:
+                raise self.__exhausted(download)
+            if self.strategy == "round_robin":
+                account = candidates[0]
+            else:
+                account = min(candidates, key=lambda a: a.in_flight)
+            account.in_flight += 1
+            account.requests += 1
+            return account
+
+    def __exhausted(self, file_id):
+        return AllAccountsExhausted(ceil(min(a.rested_for(file_id) for a in self.__accounts)))
+
+    def check_download(self, file_id):
+        # before any header is sent, so the client gets a 503 and not a cut stream
+        with self.__lock:
+            if not any(a.can_download(file_id) for a in self.__accounts):
+                raise self.__exhausted(file_id)
+
+    def release(self, account, failed=False):
+        with self.__lock:
+            account.in_flight -= 1
+            if failed:
+                account.errors += 1
+
+    @contextmanager
+    def use(self, exclude=()):
+        account = self.acquire(exclude)
+        failed = False
+        try:
+            yield account
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(account, failed)
+
+    @contextmanager
+    def client(self):
+        # an account's service plus a connection nobody else is using
+        with self.use() as account, account.http() as http:
+            yield account.service, http
+
+    def mark_exhausted(self, account, reason, file_id):
+        with self.__lock:
+            account.quota_hits += 1
+            until = monotonic() + Var.QUOTA_COOLDOWN
+            if reason == "dailyLimitExceeded":
+                account.exhausted_until = until
+                what = "downloads"
+            else:
+                # downloadQuotaExceeded, only this file is over its quota
+                account.rest_file(file_id, until)
+                what = f"downloads of {file_id}"
+        LOGGER.info(f"{account.name} hit {reason}, resting its {what} for {Var.QUOTA_COOLDOWN}s")
+
+    def stats(self):
+        with self.__lock:
+            return [a.stats() for a in self.__accounts]
@@ -0,0 +1,192 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# whole folders as one streaming zip (stored, zip64), the next few files are
+# fetched while the current one is written so drive latency overlaps
+
+from collections import deque
+from contextlib import aclosing
+from datetime import datetime
+from logging import getLogger
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+
+from googleapiclient.errors import HttpError
+
+from .config import Var
+from .resilience import error_reason
+from .utils import content_version, asyncio
+
+LOGGER = getLogger(__name__)
+
+# the file itself is gone or can't be had, any other error may pass
+SKIP_REASONS = ["cannotDownload", "cannotDownloadAbusiveFile"]
+
+
+def is_permanent(err):
+    return isinstance(err, HttpError) and (
+        err.resp.status == 404 or (err.resp.status == 403 and error_reason(err) in SKIP_REASONS)
+    )
+
+
+class _Sink:
+    # unseekable file for zipfile, so it writes data descriptors and never
+    # seeks back, whatever it writes is handed to the client as is
+    def __init__(self):
+        self.__pieces = []
+        self.__position = 0
+
+    def write(self, data):
+        self.__pieces.append(data)
+        self.__position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.__position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        pieces, self.__pieces = self.__pieces, []
+        return pieces
+
+
+def zip_info(path, modified_time):
+    date_time = (1980, 1, 1, 0, 0, 0)
+    if modified_time:
+        stamp = datetime.fromisoformat(modified_time.replace("Z", "+00:00"))
+        date_time = max(stamp.timetuple()[:6], date_time)
+    info = ZipInfo(path, date_time)
+    info.compress_type = ZIP_STORED
+    return info
+
+
+class FolderArchive:
+    def __init__(self, iter_folder, stream_file, parallel=Var.ZIP_PARALLEL, buffer=Var.ZIP_BUFFER * 1024 * 1024):
+        # GoogleDriver's listing and download streams, zipped files hit its caches
+        self.__iter_folder = iter_folder
+        self.__stream_file = stream_file
+        self.parallel = max(parallel, 1)
+        self.buffer = max(buffer, Var.NET_CHUNK_SIZE * 1024)
+        # stream_file yields NET_CHUNK_SIZE pieces, bound each file's backlog
+        self.depth = max(self.buffer // (Var.NET_CHUNK_SIZE * 1024), 1)
+
+    async def __walk(self, folder_id, prefix, seen):
+        # depth first, files of a folder before its sub folders
+        seen.add(folder_id)
+        folders, names = [], set()
+
+        def _unique(name):
+            name = name.replace("/", "_") or "_"
+            stem, dot, ext = name.rpartition(".") if "." in name.lstrip(".") else (name, "", "")
+            candidate, n = name, 1
+            while candidate in names:
+                candidate = f"{stem} ({n}){dot}{ext}"
+                n += 1
+            names.add(candidate)
+            return candidate
+
+        async with aclosing(self.__iter_folder(folder_id)) as pages:
+            async for items, _ in pages:
+                for item in items:
+                    if item["type"] == "folder":
+                        folders.append(item)
+                    elif not (item["mime_type"] or "").startswith("application/vnd.google-apps."):
+                        # native docs/sheets have no bytes to download
+                        yield prefix + _unique(item["name"]), item
+
+        for folder in folders:
+            # shortcuts can point back up the tree
+            if folder["id"] in seen:
+                continue
+            async with aclosing(self.__walk(folder["id"], f"{prefix}{_unique(folder['name'])}/", seen)) as entries:
+                async for entry in entries:
+                    yield entry
+
+    async def __fetch(self, item, queue):
+        size = item.get("bytes")
+        if size == 0:
+            # drive answers an empty file's "bytes=0-" with 416, don't ask
+            await queue.put(None)
+            return
+        try:
+            # a known size and revision lets the download use the chunk cache
+            # and share a running download, queued pieces are views that pin
+            # their upstream chunk so keep those no bigger than the buffer
+            stream = self.__stream_file(
+                item["id"],
+                end=size - 1 if size else None,
+                version=content_version(item) if size else None,
+                size=size,
+                chunk_size=self.buffer,
+            )
+            async with aclosing(stream):
+                async for piece in stream:
+                    await queue.put(piece)
+            await queue.put(None)
+        except HttpError as err:
+            # listed size can be stale, an emptied file still comes back as 416
+            await queue.put(None if err.resp.status == 416 else err)
+        except Exception as err:
+            await queue.put(err)
+
+    async def stream(self, folder_id):
+        sink = _Sink()
+        archive = ZipFile(sink, "w", ZIP_STORED, allowZip64=True)
+        entries = self.__walk(folder_id, "", set())
+        pending = deque()
+        head = None
+        walked = False
+        try:
+            while True:
+                # keep the next `parallel` files downloading behind the current one
+                while not walked and len(pending) < self.parallel:
+                    try:
+                        path, item = await entries.__anext__()
+                    except StopAsyncIteration:
+                        walked = True
+                        break
+                    queue = asyncio.Queue(self.depth)
+                    pending.append((path, item, queue, asyncio.ensure_future(self.__fetch(item, queue))))
+                if not pending:
+                    break
+
+                path, item, queue, head = pending.popleft()
+                piece = await queue.get()
+                if isinstance(piece, Exception):
+                    if not is_permanent(piece):
+                        # a zip quietly missing files looks complete, better
+                        # the client sees it cut short and tries again
+                        LOGGER.warning(f"Aborting folder zip of {folder_id} at {path} ({item['id']}): {piece}")
+                        raise piece
+                    # nothing of it was written yet, leave it out rather than fail the lot
+                    LOGGER.warning(f"Skipping {path} ({item['id']}) in folder zip: {piece}")
+                    head = None
+                    continue
+
+                with archive.open(zip_info(path, item.get("modified_time")), "w", force_zip64=True) as dest:
+                    while piece is not None:
+                        if isinstance(piece, Exception):
+                            raise piece
+                        dest.write(piece)
+                        for data in sink.drain():
+                            yield data
+                        piece = await queue.get()
+                head = None
+                for data in sink.drain():
+                    yield data
+
+            archive.close()
+            for data in sink.drain():
+                yield data
+        finally:
+            # the file being written is no longer in pending, stop it too
+            tasks = [task for _, _, _, task in pending] + ([head] if head is not None else [])
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await entries.aclose()
@@ -0,0 +1,92 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+from collections import OrderedDict
+from time import monotonic
+
+from .metrics import CACHE_LOOKUPS
+from .utils import asyncio
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize, ttl, name="cache"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, value), ordered from least to most recently used
+        self.__data = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key):
+        item = self.__data.get(key)
+        if item is None or item[0] < monotonic():
+            if item is not None:
+                del self.__data[key]
+            self.misses += 1
+            CACHE_LOOKUPS.labels(self.name, "miss").inc()
+            return MISSING
+        self.__data.move_to_end(key)
+        self.hits += 1
+        CACHE_LOOKUPS.labels(self.name, "hit").inc()
+        return item[1]
+
+    def peek(self, key):
+        # like get, without touching stats or recency
+        item = self.__data.get(key)
+        if item is None or item[0] < monotonic():
+            return MISSING
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if not self.enabled or ttl <= 0:
+            return
+        self.__data[key] = (monotonic() + ttl, value)
+        self.__data.move_to_end(key)
+        while len(self.__data) > self.maxsize:
+            self.__data.popitem(last=False)
+
+    def pop(self, key):
+        self.__data.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.__data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class NegativeEntry:
+    # remembers an upstream failure (e.g. 404) so we can re-raise it
+    # without asking drive again
+    def __init__(self, error):
+        self.error = error
+
+
+class SingleFlight:
+    # collapses concurrent calls for the same key into one upstream call
+    def __init__(self):
+        self.__calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self.__calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self.__calls[key] = task
+            task.add_done_callback(lambda _: self.__calls.pop(key, None))
+        # shielded so one disconnecting caller doesn't cancel it for the rest
+        return await asyncio.shield(task)
@@ -11,4 +11,66 @@ from decouple import config
 class Var:
     IS_SERVICE_ACCOUNT = config("IS_SERVICE_ACCOUNT", default=False, cast=bool)
     SERVER_SIDE_SPEED = config("SERVER_SIDE_SPEED", default=25, cast=int) # in mega bytes
-    ROOT_FOLDER_ID = config("ROOT_FOLDER_ID")
\ No newline at end of file
+    ROOT_FOLDER_ID = config("ROOT_FOLDER_ID")
+    META_WORKERS = config("META_WORKERS", default=0, cast=int) # threads for metadata/listing calls (0 = cpu * 5)
+    MEDIA_WORKERS = config("MEDIA_WORKERS", default=0, cast=int) # threads for media chunk downloads (0 = cpu * 5)
+    STREAM_BACKEND = config("STREAM_BACKEND", default="aiohttp") # aiohttp or httplib2 (legacy, thread per chunk)
+    HTTP_POOL_SIZE = config("HTTP_POOL_SIZE", default=100, cast=int) # max keep-alive connections per worker (0 = unlimited)
+    CACHE_DIR = config("CACHE_DIR", default=".cache") # where hot file chunks are kept on disk
+    CACHE_SIZE = config("CACHE_SIZE", default=1024, cast=int) # disk budget for chunk cache in mega bytes (0 = disabled)
+    CACHE_CHUNK_SIZE = config("CACHE_CHUNK_SIZE", default=4, cast=int) # cache granularity in mega bytes
+    CACHE_POLICY = config("CACHE_POLICY", default="lru") # lru or lfu eviction
+    META_CACHE_TTL = config("META_CACHE_TTL", default=300, cast=int) # seconds file metadata is cached (0 = disabled)
+    META_CACHE_SIZE = config("META_CACHE_SIZE", default=10000, cast=int) # max cached metadata entries per worker
+    NEGATIVE_CACHE_TTL = config("NEGATIVE_CACHE_TTL", default=30, cast=int) # seconds a 404 is remembered
+    FANOUT_BUFFER = config("FANOUT_BUFFER", default=32, cast=int) # mega bytes shared per coalesced download (0 = disabled)
+    PARALLEL_SEGMENTS = config("PARALLEL_SEGMENTS", default=1, cast=int) # concurrent drive connections per large stream (1 = serial)
+    SEGMENT_SIZE = config("SEGMENT_SIZE", default=8, cast=int) # mega bytes fetched by each parallel segment
+    READ_AHEAD_SEGMENTS = config("READ_AHEAD_SEGMENTS", default=4, cast=int) # segments buffered ahead of the client, bounds memory
+    SEARCH_INDEX = config("SEARCH_INDEX", default=True, cast=bool) # answer /search from a local sqlite index of ROOT_FOLDER_ID
+    INDEX_PATH = config("INDEX_PATH", default="index.db") # where the search index is stored
+    INDEX_REFRESH = config("INDEX_REFRESH", default=60, cast=int) # seconds between drive changes feed polls
+    INDEX_CONCURRENCY = config("INDEX_CONCURRENCY", default=8, cast=int) # folders listed at once while crawling
+    SHORTCUT_CACHE_TTL = config("SHORTCUT_CACHE_TTL", default=3600, cast=int) # seconds resolved shortcut targets are cached
+    RETRY_LIMIT = config("RETRY_LIMIT", default=6, cast=int) # retries of a failing drive call (5xx, 429, rate limits, network)
+    RETRY_BASE_DELAY = config("RETRY_BASE_DELAY", default=0.5, cast=float) # seconds, backoff doubles from here with full jitter
+    RETRY_MAX_DELAY = config("RETRY_MAX_DELAY", default=20, cast=float) # seconds, cap on a single backoff
+    HEDGE_REQUESTS = config("HEDGE_REQUESTS", default=True, cast=bool) # send a duplicate drive call once one is slower than its p95
+    HEDGE_MIN_DELAY = config("HEDGE_MIN_DELAY", default=100, cast=int) # milli seconds, never hedge sooner than this
+    BREAKER_THRESHOLD = config("BREAKER_THRESHOLD", default=5, cast=int) # consecutive failed calls (not retries) before an endpoint fails fast
+    BREAKER_COOLDOWN = config("BREAKER_COOLDOWN", default=30, cast=int) # seconds an endpoint fails fast before a trial call
+    SA_STRATEGY = config("SA_STRATEGY", default="least_loaded") # least_loaded or round_robin account selection
+    QUOTA_COOLDOWN = config("QUOTA_COOLDOWN", default=3600, cast=int) # seconds an account stops downloading a file (downloadQuotaExceeded) or anything (dailyLimitExceeded)
+    DRIVE_CLIENTS = config("DRIVE_CLIENTS", default=32, cast=int) # max live api connections per account per worker
+    DRIVE_API_URL = config("DRIVE_API_URL", default="https://www.googleapis.com/drive/v3/") # point at bench/fake_drive.py for offline benchmarks
+    MEDIA_PREFETCH_HEAD = config("MEDIA_PREFETCH_HEAD", default=8, cast=int) # mega bytes cached from the start of a video/audio once it's downloaded (0 = disabled)
+    MEDIA_PREFETCH_TAIL = config("MEDIA_PREFETCH_TAIL", default=4, cast=int) # mega bytes cached from the end, where moov/index atoms live (0 = disabled)
+    MEDIA_READ_AHEAD = config("MEDIA_READ_AHEAD", default=2, cast=int) # cache chunks fetched past each video/audio range request (0 = disabled)
+    MEDIA_PREFETCH_CONCURRENCY = config("MEDIA_PREFETCH_CONCURRENCY", default=4, cast=int) # background prefetches running at once per worker
+    ADAPTIVE_CHUNKS = config("ADAPTIVE_CHUNKS", default=True, cast=bool) # start small and grow upstream chunks with the client's drain rate
+    FIRST_CHUNK_SIZE = config("FIRST_CHUNK_SIZE", default=256, cast=int) # kilo bytes of the first upstream chunk when ADAPTIVE_CHUNKS is on
+    NET_CHUNK_SIZE = config("NET_CHUNK_SIZE", default=256, cast=int) # kilo bytes handed to the client per write
+    SHARED_CACHE = config("SHARED_CACHE", default=True, cast=bool) # share metadata/listing caches between workers through sqlite
+    SHARED_CACHE_PATH = config("SHARED_CACHE_PATH", default="cache.db") # where the shared cache lives, one per host
+    SHARED_CACHE_SIZE = config("SHARED_CACHE_SIZE", default=50000, cast=int) # max entries in the shared cache
+    LIST_CACHE_TTL = config("LIST_CACHE_TTL", default=120, cast=int) # seconds a whole folder listing is fresh (0 = always ask drive)
+    LIST_STALE_TTL = config("LIST_STALE_TTL", default=600, cast=int) # extra seconds a stale listing is served while it refreshes
+    LIST_CACHE_SIZE = config("LIST_CACHE_SIZE", default=500, cast=int) # max cached folder listings per worker
+    LIST_PREFETCH = config("LIST_PREFETCH", default=8, cast=int) # subfolders of a visited folder listed in the background (0 = disabled)
+    ZIP_PARALLEL = config("ZIP_PARALLEL", default=4, cast=int) # files of a folder zip downloading at once
+    ZIP_BUFFER = config("ZIP_BUFFER", default=8, cast=int) # mega bytes buffered per file of a folder zip that is ahead of the client
+    POPULARITY_HALF_LIFE = config("POPULARITY_HALF_LIFE", default=3600, cast=int) # seconds after which access counts are halved (0 = never)
+    WARMUP = config("WARMUP", default=True, cast=bool) # keep the most requested files/folders warm in the background
+    WARMUP_TOP = config("WARMUP_TOP", default=50, cast=int) # how many of the most requested ids are kept warm
+    WARMUP_INTERVAL = config("WARMUP_INTERVAL", default=60, cast=int) # seconds between warm-up rounds
+    WARMUP_CALLS = config("WARMUP_CALLS", default=30, cast=int) # max drive metadata/listing calls per warm-up round
+    WARMUP_MB = config("WARMUP_MB", default=64, cast=int) # max mega bytes downloaded per warm-up round
+    WARMUP_HEAD = config("WARMUP_HEAD", default=4, cast=int) # mega bytes cached from the start of each hot file
+    DL_CACHE_CONTROL = config("DL_CACHE_CONTROL", default="public, max-age=86400") # Cache-Control sent by /dl (empty = none)
+    INFO_CACHE_CONTROL = config("INFO_CACHE_CONTROL", default="public, max-age=60") # Cache-Control sent by /info (empty = none)
+    LIST_CACHE_CONTROL = config("LIST_CACHE_CONTROL", default="public, max-age=30") # Cache-Control sent by /folders/list (empty = none)
+    SERVER_TIMING = config("SERVER_TIMING", default=True, cast=bool) # per request timing spans, sent as Server-Timing
+    SLOW_REQUEST_MS = config("SLOW_REQUEST_MS", default=1000, cast=int) # requests whose first byte took longer are kept for /debug/slow
+    SLOW_REQUESTS = config("SLOW_REQUESTS", default=50, cast=int) # how many slow requests are kept per worker
+    DEBUG_PROFILE = config("DEBUG_PROFILE", default=False, cast=bool) # enables the /debug/profile sampling profiler
+    PROFILE_MAX_SECONDS = config("PROFILE_MAX_SECONDS", default=60, cast=int) # longest profile /debug/profile will take
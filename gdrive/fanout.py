@@ -0,0 +1,176 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# one upstream download shared by every client streaming the same file
+
+from collections import deque
+from contextlib import aclosing
+from logging import getLogger
+
+from .utils import asyncio
+
+LOGGER = getLogger(__name__)
+
+
+class _Detached(Exception):
+    pass
+
+
+class _Broadcast:
+    def __init__(self, upstream, start, end, capacity, on_close):
+        self.start = start  # offset of the oldest byte still in the ring
+        self.head = start  # offset right after the newest byte received
+        self.end = end  # last byte upstream was asked for
+        self.capacity = capacity
+        self.done = False
+        self.failed = False
+        self.__ring = deque()  # (offset, piece)
+        self.__ring_bytes = 0
+        self.__readers = {}  # reader -> [position, end]
+        self.__cond = asyncio.Condition()
+        self.__on_close = on_close
+        self.__task = asyncio.ensure_future(self.__pump(upstream))
+
+    def can_join(self, start):
+        return not self.done and self.start <= start <= min(self.head, self.end)
+
+    def attach(self, start, end):
+        reader = object()
+        self.__readers[reader] = [start, end]
+        return reader
+
+    def __needed(self):
+        return [r for r in self.__readers.values() if r[1] >= self.head]
+
+    async def __pump(self, upstream):
+        try:
+            async with aclosing(upstream):
+                async for piece in upstream:
+                    async with self.__cond:
+                        self.__ring.append((self.head, piece))
+                        self.__ring_bytes += len(piece)
+                        self.head += len(piece)
+                        while len(self.__ring) > 1 and self.__ring_bytes - len(self.__ring[0][1]) >= self.capacity:
+                            _, old = self.__ring.popleft()
+                            self.__ring_bytes -= len(old)
+                        self.start = self.__ring[0][0]
+                        self.__cond.notify_all()
+
+                        if self.head > self.end:
+                            # all asked for is in, let the response finish
+                            # rather than closing it under the connection
+                            continue
+
+                        # pace ourselves to the fastest reader, slow ones detach
+                        while True:
+                            needed = self.__needed()
+                            if not needed:
+                                return
+                            if self.head - max(r[0] for r in needed) < self.capacity // 2:
+                                break
+                            await self.__cond.wait()
+        except Exception as err:
+            LOGGER.warning(f"Shared stream failed, readers will detach: {err}")
+            self.failed = True
+        finally:
+            self.done = True
+            self.__on_close(self)
+            async with self.__cond:
+                self.__cond.notify_all()
+
+    async def read(self, reader):
+        position, end = self.__readers[reader]
+        try:
+            while position <= end:
+                async with self.__cond:
+                    while True:
+                        if position < self.start or self.failed:
+                            raise _Detached(position)
+                        if position < self.head:
+                            break
+                        if self.done:
+                            # upstream ended early, let the caller carry on alone
+                            raise _Detached(position)
+                        await self.__cond.wait()
+
+                    for offset, piece in self.__ring:
+                        if offset <= position < offset + len(piece):
+                            break
+                    stop = min(end + 1, offset + len(piece))
+                    data = memoryview(piece)[position - offset:stop - offset]
+                    position = stop
+                    self.__readers[reader][0] = position
+                    self.__cond.notify_all()
+
+                yield data
+        finally:
+            self.__readers.pop(reader, None)
+            async with self.__cond:
+                self.__cond.notify_all()
+
+
+class FanOut:
+    def __init__(self, opener, capacity):
+        # opener(file_id, start, end) -> async iterator of bytes from drive
+        self.__opener = opener
+        self.__capacity = capacity
+        self.__broadcasts = {}
+        self.shared = 0
+        self.detached = 0
+
+    @property
+    def enabled(self):
+        return self.__capacity > 0
+
+    def __remove(self, key, broadcast):
+        streams = self.__broadcasts.get(key, [])
+        if broadcast in streams:
+            streams.remove(broadcast)
+        if not streams:
+            self.__broadcasts.pop(key, None)
+
+    async def stream(self, file_id, version, start, end):
+        key = (file_id, version)
+        position = start
+        try:
+            while position <= end:
+                # a download only ever runs to the end its opener asked for, a
+                # reader wanting more carries on from there with the next one
+                broadcast = next(
+                    (b for b in self.__broadcasts.get(key, []) if b.can_join(position)), None
+                )
+                if broadcast is None:
+                    broadcast = _Broadcast(
+                        self.__opener(file_id, position, end),
+                        position,
+                        end,
+                        self.__capacity,
+                        lambda b: self.__remove(key, b),
+                    )
+                    self.__broadcasts.setdefault(key, []).append(broadcast)
+                else:
+                    self.shared += 1
+
+                reader = broadcast.attach(position, min(end, broadcast.end))
+                async with aclosing(broadcast.read(reader)) as shared:
+                    async for data in shared:
+                        yield data
+                        position += len(data)
+            return
+        except _Detached:
+            self.detached += 1
+
+        async with aclosing(self.__opener(file_id, position, end)) as own:
+            async for data in own:
+                yield data
+
+    def stats(self):
+        return {
+            "live_streams": sum(len(s) for s in self.__broadcasts.values()),
+            "shared_readers": self.shared,
+            "detached_readers": self.detached,
+        }
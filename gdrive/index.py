@@ -0,0 +1,266 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# local sqlite fts5 index of the drive tree, so /search never hits drive
+
+from fcntl import flock, LOCK_EX, LOCK_NB
+from logging import getLogger
+
+from .config import Var
+from .utils import run_async, hbs, asyncio, SQLiteConnections
+
+LOGGER = getLogger(__name__)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+FILE_FIELDS = "id, name, mimeType, size, modifiedTime, parents"
+HIDDEN_MIME_TYPES = (
+    "application/vnd.google-apps.shortcut",
+    "application/vnd.google-apps.document",
+    "application/vnd.google-apps.spreadsheet",
+    "application/vnd.google-apps.form",
+    "application/vnd.google-apps.site",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mime_type TEXT,
+    size INTEGER DEFAULT 0,
+    parent TEXT,
+    modified_time TEXT
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files(parent);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, content='files', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts(rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    INSERT INTO files_fts(rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class SearchIndex:
+    def __init__(self, files_list, changes_list, changes_start_token, path=Var.INDEX_PATH):
+        # files.list/changes.list of GoogleDriver, already retried and failed over
+        self.__files_list = files_list
+        self.__changes_list = changes_list
+        self.__changes_start_token = changes_start_token
+        self.path = path
+        self.__conn = SQLiteConnections(path, SCHEMA, timeout=30)
+        self.__lock_file = None
+
+    @property
+    def enabled(self):
+        return Var.SEARCH_INDEX
+
+    def __is_maintainer(self):
+        # only one gunicorn worker crawls, the rest just read
+        if self.__lock_file is None:
+            lock_file = open(f"{self.path}.lock", "w")
+            try:
+                flock(lock_file, LOCK_EX | LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.__lock_file = lock_file
+        return True
+
+    @run_async
+    def __get_meta(self, key):
+        row = self.__conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @run_async
+    def __set_meta(self, key, value):
+        with self.__conn() as conn:
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    @run_async
+    def __upsert(self, files, parent=None):
+        with self.__conn() as conn:
+            conn.executemany(
+                "INSERT INTO files(id, name, mime_type, size, parent, modified_time) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "name = excluded.name, mime_type = excluded.mime_type, size = excluded.size, "
+                "parent = excluded.parent, modified_time = excluded.modified_time",
+                [
+                    (
+                        f["id"],
+                        f.get("name", ""),
+                        f.get("mimeType"),
+                        int(f.get("size", 0)),
+                        parent or (f.get("parents") or [None])[0],
+                        f.get("modifiedTime"),
+                    )
+                    for f in files
+                ],
+            )
+
+    @run_async
+    def __delete(self, file_ids):
+        # drive only reports the folder that moved/was trashed, its subtree
+        # goes with it, UNION (not ALL) so a parent cycle can't loop forever
+        with self.__conn() as conn:
+            conn.executemany(
+                "WITH RECURSIVE subtree(id) AS (SELECT ? UNION "
+                "SELECT f.id FROM files f JOIN subtree s ON f.parent = s.id) "
+                "DELETE FROM files WHERE id IN subtree",
+                [(i,) for i in file_ids],
+            )
+
+    @run_async
+    def __known_folder(self, folder_id):
+        if folder_id == Var.ROOT_FOLDER_ID:
+            return True
+        return self.__conn().execute(
+            "SELECT 1 FROM files WHERE id = ? AND mime_type = ?",
+            (folder_id, FOLDER_MIME_TYPE),
+        ).fetchone() is not None
+
+    async def __crawl_folder(self, folder_id, limiter):
+        page_token = None
+        sub_folders = []
+        async with limiter:
+            while True:
+                response = await self.__files_list(
+                    q=f"'{folder_id}' in parents and trashed = false",
+                    fields=f"nextPageToken, files({FILE_FIELDS})",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True,
+                )
+                files = response.get("files", [])
+                await self.__upsert(files, parent=folder_id)
+                sub_folders += [f["id"] for f in files if f.get("mimeType") == FOLDER_MIME_TYPE]
+                page_token = response.get("nextPageToken")
+                if not page_token:
+                    break
+        await asyncio.gather(*[self.__crawl_folder(f, limiter) for f in sub_folders])
+
+    async def crawl(self, folder_id=Var.ROOT_FOLDER_ID):
+        LOGGER.info(f"Building search index from {folder_id}")
+        # take the change token first so nothing that changes mid crawl is lost
+        start_token = await self.__changes_start_token()
+        await self.__crawl_folder(folder_id, asyncio.Semaphore(Var.INDEX_CONCURRENCY))
+        await self.__set_meta("changes_token", start_token)
+        await self.__set_meta("ready", "1")
+        LOGGER.info("Search index is ready")
+
+    async def sync_changes(self):
+        page_token = await self.__get_meta("changes_token")
+        while page_token:
+            response = await self.__changes_list(
+                pageToken=page_token,
+                pageSize=1000,
+                includeRemoved=True,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}, trashed))",
+            )
+            removed, updated, new_folders = [], [], []
+            for change in response.get("changes", []):
+                file = change.get("file")
+                if change.get("removed") or not file or file.get("trashed"):
+                    removed.append(change["fileId"])
+                    continue
+                parent = (file.get("parents") or [None])[0]
+                if parent and await self.__known_folder(parent):
+                    updated.append(file)
+                    if file.get("mimeType") == FOLDER_MIME_TYPE and not await self.__known_folder(file["id"]):
+                        new_folders.append(file["id"])
+                else:
+                    # moved out of the indexed tree, along with whatever is under it
+                    removed.append(file["id"])
+
+            if removed:
+                await self.__delete(removed)
+            if updated:
+                await self.__upsert(updated)
+            for folder_id in new_folders:
+                # a folder moved in brings its whole subtree along
+                await self.__crawl_folder(folder_id, asyncio.Semaphore(Var.INDEX_CONCURRENCY))
+
+            if response.get("newStartPageToken"):
+                await self.__set_meta("changes_token", response["newStartPageToken"])
+                break
+            page_token = response.get("nextPageToken")
+            await self.__set_meta("changes_token", page_token)
+
+    async def run(self):
+        while True:
+            try:
+                if self.__is_maintainer():
+                    if await self.__get_meta("ready") != "1":
+                        await self.crawl()
+                    else:
+                        await self.sync_changes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                LOGGER.error(f"Search index refresh failed: {err}")
+            await asyncio.sleep(Var.INDEX_REFRESH)
+
+    async def is_ready(self):
+        return self.enabled and await self.__get_meta("ready") == "1"
+
+    @run_async
+    def search(self, query, offset=0, page_size=100):
+        all_items = []
+        info = {
+            "total_files": 0,
+            "total_folders": 0,
+            "total_files_size": 0,
+            "page_token": None
+        }
+        # every word must match, each as a prefix, ranked by bm25
+        words = [w.replace('"', '""') for w in query.split()]
+        if not words:
+            return all_items, info
+        match = " AND ".join(f'"{w}"*' for w in words)
+
+        rows = self.__conn().execute(
+            "SELECT f.id, f.name, f.mime_type, f.size FROM files_fts "
+            "JOIN files f ON f.rowid = files_fts.rowid "
+            f"WHERE files_fts MATCH ? AND f.mime_type NOT IN ({', '.join('?' * len(HIDDEN_MIME_TYPES))}) "
+            "AND f.name != '.password' "
+            "ORDER BY bm25(files_fts), f.name LIMIT ? OFFSET ?",
+            (match, *HIDDEN_MIME_TYPES, page_size + 1, offset),
+        ).fetchall()
+
+        for file_id, name, mime_type, size in rows[:page_size]:
+            item_type = "folder" if mime_type == FOLDER_MIME_TYPE else "file"
+            all_items.append({
+                "id": file_id,
+                "name": name,
+                "mime_type": mime_type,
+                "size": hbs(size),
+                "type": item_type,
+            })
+            if item_type == "folder":
+                info["total_folders"] += 1
+            else:
+                info["total_files"] += 1
+                info["total_files_size"] += size
+
+        if len(rows) > page_size:
+            info["page_token"] = str(offset + page_size)
+        return all_items, info
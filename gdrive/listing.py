@@ -0,0 +1,219 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# whole folder listings cached per folder and paged locally, so browsing
+# never waits on a chain of drive page tokens
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_right
+from binascii import Error as B64Error
+from logging import getLogger
+from time import time
+
+from googleapiclient.errors import HttpError
+
+from .cache import TTLCache, SingleFlight, MISSING
+from .config import Var
+from .utils import hbs, asyncio
+
+LOGGER = getLogger(__name__)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+CURSOR_PREFIX = "c."
+
+
+def sort_key(item):
+    # folders first then by name, id breaks ties so cursors stay unambiguous
+    return (item["type"] != "folder", item["name"].casefold(), item["id"])
+
+
+def encode_cursor(item):
+    return CURSOR_PREFIX + urlsafe_b64encode(json.dumps(sort_key(item)).encode()).decode()
+
+
+def decode_cursor(token):
+    if not token or not token.startswith(CURSOR_PREFIX):
+        return None
+    try:
+        key = json.loads(urlsafe_b64decode(token[len(CURSOR_PREFIX):].encode()))
+    except (B64Error, ValueError):
+        return None
+    if not isinstance(key, list) or len(key) != 3:
+        return None
+    # has to compare against real sort keys, anything else is a forged token
+    if not isinstance(key[0], bool) or not all(isinstance(k, str) for k in key[1:]):
+        return None
+    return tuple(key)
+
+
+class FolderListings:
+    def __init__(
+        self,
+        files_list,
+        resolve_shortcuts,
+        shared,
+        ttl=Var.LIST_CACHE_TTL,
+        stale=Var.LIST_STALE_TTL,
+        maxsize=Var.LIST_CACHE_SIZE,
+        prefetch=Var.LIST_PREFETCH,
+    ):
+        # files.list and shortcut resolution of GoogleDriver, so listings share its accounts
+        self.__files_list = files_list
+        self.__resolve_shortcuts = resolve_shortcuts
+        self.__shared = shared
+        self.ttl = ttl
+        self.stale = max(stale, 0)
+        self.prefetch = prefetch
+        # entries outlive their ttl by `stale` seconds, served while refreshing
+        self.__cache = TTLCache(maxsize, ttl + self.stale, name="listings")
+        self.__flight = SingleFlight()
+        self.__limiter = asyncio.Semaphore(2)
+        self.__tasks = set()
+        self.__pending = set()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.__cache.maxsize > 0
+
+    def has(self, folder_id):
+        return self.__cache.peek(folder_id) is not MISSING
+
+    def owns(self, page_token):
+        # drive's own page tokens still go straight to drive
+        return not page_token or decode_cursor(page_token) is not None
+
+    async def __fetch(self, folder_id):
+        rows, page_token = [], None
+        while True:
+            response = await self.__files_list(
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                q=f"'{folder_id}' in parents and trashed = false",
+                spaces="drive",
+                pageSize=1000,
+                fields=(
+                    "nextPageToken, "
+                    "files(id, name, mimeType, size, md5Checksum, modifiedTime, shortcutDetails)"
+                ),
+                pageToken=page_token,
+            )
+            files = response.get("files", [])
+            targets = await self.__resolve_shortcuts(files)
+            for file in files:
+                shortcut = file.get("shortcutDetails")
+                if shortcut:
+                    file = targets.get(shortcut.get("targetId"))
+                    if not file:
+                        LOGGER.warning(f"Shortcut target not found: {shortcut.get('targetId')}")
+                        continue
+                size = int(file.get("size", 0))
+                item = {
+                    "id": file.get("id"),
+                    "name": file.get("name"),
+                    "mime_type": file.get("mimeType"),
+                    "size": hbs(size),
+                    "bytes": size,
+                    "parent_folder_id": folder_id,
+                    "type": "folder" if file.get("mimeType") == FOLDER_MIME_TYPE else "file",
+                    "md5_checksum": file.get("md5Checksum"),
+                    "modified_time": file.get("modifiedTime"),
+                }
+                rows.append((sort_key(item), item, size))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        rows.sort(key=lambda row: row[0])
+        entry = {
+            "fetched_at": time(),
+            "items": [item for _, item, _ in rows],
+            "sizes": [size for _, _, size in rows],
+        }
+        self.__cache.set(folder_id, entry)
+        await self.__shared.set("listings", folder_id, entry, self.ttl + self.stale)
+        return entry
+
+    async def __load(self, folder_id, fresh_only=False):
+        # another worker may have listed it already, drive only if nobody has
+        cached = await self.__shared.get("listings", folder_id)
+        if cached is not MISSING:
+            entry, expires_at = cached
+            if not fresh_only or time() - entry["fetched_at"] <= self.ttl:
+                self.__cache.set(folder_id, entry, ttl=expires_at - time())
+                return entry
+        return await self.__fetch(folder_id)
+
+    async def __refresh(self, folder_id):
+        try:
+            await self.__flight.do(folder_id, self.__load, folder_id, True)
+        except HttpError as err:
+            if err.resp.status == 404:
+                self.__cache.pop(folder_id)
+                await self.__shared.delete("listings", folder_id)
+            LOGGER.warning(f"Could not refresh listing of {folder_id}: {err}")
+        except Exception as err:
+            LOGGER.warning(f"Could not refresh listing of {folder_id}: {err}")
+
+    async def __prefetch(self, folder_id):
+        try:
+            async with self.__limiter:
+                if self.__cache.peek(folder_id) is MISSING:
+                    await self.__refresh(folder_id)
+        finally:
+            self.__pending.discard(folder_id)
+
+    def __background(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def get(self, folder_id):
+        entry = self.__cache.get(folder_id)
+        if entry is MISSING:
+            return await self.__flight.do(folder_id, self.__load, folder_id)
+        if time() - entry["fetched_at"] > self.ttl:
+            # stale-while-revalidate, this caller gets the old listing right away
+            self.__background(self.__refresh(folder_id))
+        return entry
+
+    async def page(self, folder_id, page_token=None, page_size=100):
+        entry = await self.get(folder_id)
+        items, sizes = entry["items"], entry["sizes"]
+        cursor = decode_cursor(page_token)
+        start = bisect_right(items, cursor, key=sort_key) if cursor else 0
+        end = start + page_size
+
+        all_items = [dict(item) for item in items[start:end]]
+        info = {
+            "total_files": 0,
+            "total_folders": 0,
+            "total_files_size": 0,
+            "page_token": encode_cursor(items[end - 1]) if end < len(items) else None,
+        }
+        for item, size in zip(all_items, sizes[start:end]):
+            if item["type"] == "folder":
+                info["total_folders"] += 1
+            else:
+                info["total_files"] += 1
+                info["total_files_size"] += size
+
+        # warm the subfolders the visitor is most likely to open next
+        if self.prefetch > 0:
+            for item in [i for i in all_items if i["type"] == "folder"][:self.prefetch]:
+                if item["id"] not in self.__pending and self.__cache.peek(item["id"]) is MISSING:
+                    self.__pending.add(item["id"])
+                    self.__background(self.__prefetch(item["id"]))
+        return all_items, info
+
+    def stats(self):
+        return {**self.__cache.stats(), "background": len(self.__tasks)}
+
+    async def close(self):
+        for task in list(self.__tasks):
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
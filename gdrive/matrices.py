@@ -1 +1,214 @@
-# placeholder for matrices to cache hot files
\ No newline at end of file
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# disk backed chunk cache for hot files
+
+from collections import OrderedDict
+from fcntl import flock, LOCK_EX, LOCK_UN
+from hashlib import sha1
+from logging import getLogger
+from mmap import mmap, ACCESS_READ
+from os import makedirs, path as ospath, remove, replace, stat, utime, walk, getpid
+from threading import Lock, get_ident
+
+from .config import Var
+from .metrics import CACHE_LOOKUPS
+from .utils import run_async
+
+LOGGER = getLogger(__name__)
+
+
+class ChunkCache:
+    def __init__(
+        self,
+        cache_dir=Var.CACHE_DIR,
+        budget=Var.CACHE_SIZE * 1024 * 1024,
+        chunk_size=Var.CACHE_CHUNK_SIZE * 1024 * 1024,
+        policy=Var.CACHE_POLICY,
+    ):
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.chunk_size = chunk_size
+        self.policy = policy.lower()
+        self.hits = 0
+        self.misses = 0
+        # path -> [size, hits], ordered from least to most recently used
+        self.__entries = OrderedDict()
+        self.__used = 0
+        # bytes this worker wrote since it last measured the whole directory
+        self.__unmeasured = 0
+        self.__loaded = False
+        self.__lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def __path(self, file_id, version, index):
+        # content addressed, a new md5/modifiedTime never hits stale chunks
+        digest = sha1(f"{file_id}:{version}".encode()).hexdigest()
+        return ospath.join(self.cache_dir, digest[:2], digest, str(index))
+
+    def __scan(self):
+        # (mtime, path, size) of every chunk on disk, oldest first, whichever
+        # worker wrote it
+        found = []
+        for root, _, files in walk(self.cache_dir):
+            for name in files:
+                if not name.isdigit():
+                    continue
+                file_path = ospath.join(root, name)
+                try:
+                    st = stat(file_path)
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_mtime, file_path, st.st_size))
+        return sorted(found)
+
+    def __load(self):
+        if self.__loaded:
+            return
+        self.__loaded = True
+        found = self.__scan()
+        for _, file_path, size in found:
+            self.__entries[file_path] = [size, 0]
+            self.__used += size
+        if found:
+            LOGGER.info(f"Loaded {len(found)} cached chunks ({self.__used} bytes)")
+
+    def __lookup(self, file_path):
+        entry = self.__entries.get(file_path)
+        if entry is None:
+            # another worker may have written it, adopt it into our index
+            try:
+                size = stat(file_path).st_size
+            except FileNotFoundError:
+                return None
+            entry = self.__entries[file_path] = [size, 0]
+            self.__used += size
+        return entry
+
+    def has(self, file_id, version, index):
+        with self.__lock:
+            self.__load()
+            return self.__lookup(self.__path(file_id, version, index)) is not None
+
+    def get(self, file_id, version, index):
+        # returns a read-only memoryview over the mmapped chunk, the kernel's
+        # page cache backs it so nothing is copied into our heap
+        file_path = self.__path(file_id, version, index)
+        with self.__lock:
+            self.__load()
+            entry = self.__lookup(file_path)
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels("chunks", "miss").inc()
+                return None
+            try:
+                with open(file_path, "rb") as f:
+                    mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                self.__drop(file_path)
+                self.misses += 1
+                CACHE_LOOKUPS.labels("chunks", "miss").inc()
+                return None
+            entry[1] += 1
+            self.__entries.move_to_end(file_path)
+            self.hits += 1
+            try:
+                # mtime is the host wide recency every worker evicts by
+                utime(file_path)
+            except OSError:
+                pass
+        CACHE_LOOKUPS.labels("chunks", "hit").inc()
+        # never closed explicitly, it's released once the last view is sent
+        return memoryview(mapped)
+
+    @run_async(lane="media")
+    def put(self, file_id, version, index, data):
+        if not self.enabled or len(data) > self.budget:
+            return
+        file_path = self.__path(file_id, version, index)
+        if ospath.exists(file_path):
+            # a concurrent stream already cached it, chunks are immutable
+            with self.__lock:
+                self.__load()
+                self.__lookup(file_path)
+            return
+        tmp_path = f"{file_path}.{getpid()}.{get_ident()}.tmp"
+        try:
+            makedirs(ospath.dirname(file_path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            replace(tmp_path, file_path)
+        except OSError as err:
+            LOGGER.warning(f"Could not cache chunk {index} of {file_id}: {err}")
+            return
+        with self.__lock:
+            self.__load()
+            self.__drop(file_path)
+            self.__entries[file_path] = [len(data), 1]
+            self.__used += len(data)
+            self.__unmeasured += len(data)
+            # our own view only has what this worker saw, measure the real
+            # directory once it's over or others may have filled it meanwhile
+            if self.__used <= self.budget and self.__unmeasured < self.budget // 16:
+                return
+            self.__unmeasured = 0
+        self.__evict()
+
+    def __drop(self, file_path):
+        entry = self.__entries.pop(file_path, None)
+        if entry:
+            self.__used -= entry[0]
+
+    def __evict(self):
+        # CACHE_SIZE is a budget for the host, so it's enforced on what is on
+        # disk, one worker at a time, and our view is rebuilt from it
+        with open(ospath.join(self.cache_dir, ".evict.lock"), "w") as lock_file:
+            flock(lock_file, LOCK_EX)
+            try:
+                found = self.__scan()
+                used = sum(size for _, _, size in found)
+                with self.__lock:
+                    hits = {file_path: entry[1] for file_path, entry in self.__entries.items()}
+                if self.policy == "lfu":
+                    # hits are only known per worker, recency breaks the ties
+                    victims = sorted(found, key=lambda f: (hits.get(f[1], 0), f[0]))
+                else:
+                    victims = list(found)
+                evicted = set()
+                for _, file_path, size in victims:
+                    if used <= self.budget:
+                        break
+                    try:
+                        remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                    evicted.add(file_path)
+                    used -= size
+            finally:
+                flock(lock_file, LOCK_UN)
+
+        with self.__lock:
+            self.__entries = OrderedDict(
+                (file_path, [size, hits.get(file_path, 0)])
+                for _, file_path, size in found
+                if file_path not in evicted
+            )
+            self.__used = used
+
+    def stats(self):
+        with self.__lock:
+            return {
+                "policy": self.policy,
+                "chunks": len(self.__entries),
+                "used_bytes": self.__used,
+                "budget_bytes": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
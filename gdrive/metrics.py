@@ -0,0 +1,58 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# prometheus metrics, aggregated over every gunicorn worker when
+# PROMETHEUS_MULTIPROC_DIR is set (run.sh does it)
+
+from os import environ
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+DL_TTFB = Histogram(
+    "gdrive_dl_ttfb_seconds",
+    "Time from /dl request to the first body byte",
+    buckets=LATENCY_BUCKETS,
+)
+DL_BYTES = Counter("gdrive_dl_bytes", "Bytes served by /dl")
+DRIVE_LATENCY = Histogram(
+    "gdrive_api_latency_seconds",
+    "Drive API call latency",
+    ["method"],
+    buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_WAIT = Histogram(
+    "gdrive_executor_wait_seconds",
+    "Time a blocking job waits for an executor thread",
+    ["lane"],
+    buckets=LATENCY_BUCKETS,
+)
+RETRIES = Counter("gdrive_retries", "Drive calls retried", ["reason"])
+QUOTA_SWITCHES = Counter(
+    "gdrive_quota_switches", "Streams moved to another account after a quota error"
+)
+HEDGES = Counter("gdrive_hedged_requests", "Duplicate Drive calls sent after p95", ["endpoint"])
+CIRCUIT_TRIPS = Counter("gdrive_circuit_trips", "Times a Drive endpoint's breaker opened", ["endpoint"])
+CACHE_LOOKUPS = Counter("gdrive_cache_lookups", "Cache lookups", ["cache", "result"])
+
+
+def render_metrics():
+    if environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,249 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# what gets requested, in constant memory: a count-min sketch whose counters
+# halve every half life, plus a bounded set of heavy hitter candidates. the
+# warm-up scheduler keeps the top of it cached within a small drive budget
+
+from fcntl import flock, LOCK_EX, LOCK_NB
+from logging import getLogger
+from time import monotonic, time
+
+from googleapiclient.errors import HttpError
+
+from .cache import MISSING
+from .config import Var
+from .resilience import CircuitOpen
+from .utils import asyncio
+
+LOGGER = getLogger(__name__)
+
+# hits an id needs before it's worth warming, one-offs never are
+MIN_HITS = 2
+
+
+class CountMinSketch:
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.__rows = [[0] * width for _ in range(depth)]
+
+    def __cells(self, key):
+        # python's hash is salted per process, fine for a sketch that never leaves it
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        estimate = None
+        for row, cell in zip(self.__rows, self.__cells(key)):
+            row[cell] += count
+            estimate = row[cell] if estimate is None else min(estimate, row[cell])
+        return estimate
+
+    def estimate(self, key):
+        return min(row[cell] for row, cell in zip(self.__rows, self.__cells(key)))
+
+    def decay(self, halvings=1):
+        for row in self.__rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> halvings
+
+
+class Popularity:
+    def __init__(self, top=Var.WARMUP_TOP, half_life=Var.POPULARITY_HALF_LIFE):
+        self.top_n = max(top, 1)
+        self.half_life = half_life
+        self.hits = 0
+        self.__sketch = CountMinSketch()
+        # id -> "file"/"folder", only ids that made it near the top
+        self.__candidates = {}
+        self.__decayed_at = monotonic()
+
+    def __decay(self):
+        if self.half_life <= 0:
+            return
+        halvings = int((monotonic() - self.__decayed_at) // self.half_life)
+        if halvings:
+            self.__sketch.decay(min(halvings, 32))
+            self.__decayed_at += halvings * self.half_life
+            self.__candidates = {
+                key: kind for key, kind in self.__candidates.items() if self.__sketch.estimate(key)
+            }
+
+    def __prune(self):
+        ranked = sorted(self.__candidates, key=self.__sketch.estimate, reverse=True)
+        self.__candidates = {key: self.__candidates[key] for key in ranked[:self.top_n * 2]}
+
+    def hit(self, item_id, kind, count=1):
+        self.__decay()
+        self.hits += 1
+        self.__sketch.add(item_id, count)
+        self.__candidates[item_id] = kind
+        # let it overshoot a little so pruning (a sort) stays rare
+        if len(self.__candidates) > self.top_n * 4:
+            self.__prune()
+
+    def top(self, n=None):
+        self.__decay()
+        ranked = sorted(
+            ((self.__sketch.estimate(key), key, kind) for key, kind in self.__candidates.items()),
+            reverse=True,
+        )
+        return [(key, kind, hits) for hits, key, kind in ranked[:n or self.top_n] if hits >= MIN_HITS]
+
+    def forget(self, item_id):
+        self.__candidates.pop(item_id, None)
+
+    def stats(self):
+        return {"hits": self.hits, "candidates": len(self.__candidates)}
+
+
+class WarmUp:
+    def __init__(
+        self,
+        popularity,
+        shared,
+        resolve,
+        list_folder,
+        fetch_head,
+        busy,
+        interval=Var.WARMUP_INTERVAL,
+        calls=Var.WARMUP_CALLS,
+        budget=Var.WARMUP_MB * 1024 * 1024,
+        lock_path=f"{Var.SHARED_CACHE_PATH}.warmup.lock",
+    ):
+        # resolve(id) -> (info, calls), list_folder(id) -> calls,
+        # fetch_head(info, budget) -> bytes, busy() -> whether live traffic is queueing
+        self.__popularity = popularity
+        self.__shared = shared
+        self.__resolve = resolve
+        self.__list_folder = list_folder
+        self.__fetch_head = fetch_head
+        self.__busy = busy
+        self.interval = interval
+        self.calls = calls
+        self.budget = budget
+        self.lock_path = lock_path
+        self.__lock_file = None
+        self.cycles = 0
+        self.warmed = 0
+        self.spent_calls = 0
+        self.spent_bytes = 0
+        self.yielded = 0
+        self.last_cycle = None
+
+    @property
+    def enabled(self):
+        return Var.WARMUP and self.interval > 0 and (self.calls > 0 or self.budget > 0)
+
+    def __is_warmer(self):
+        # the budget is per host, only one gunicorn worker spends it
+        if self.__lock_file is None:
+            lock_file = open(self.lock_path, "w")
+            try:
+                flock(lock_file, LOCK_EX | LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.__lock_file = lock_file
+        return True
+
+    async def __restore(self):
+        # what was hot before the restart/deploy, saved by the previous workers
+        cached = await self.__shared.get("popularity", "top")
+        if cached is MISSING:
+            return
+        for item_id, kind, hits in cached[0]:
+            self.__popularity.hit(item_id, kind, hits)
+        LOGGER.info(f"Restored {len(cached[0])} popular items")
+
+    async def __save(self, top):
+        # every worker saves its view, merged by the highest count per id
+        cached = await self.__shared.get("popularity", "top")
+        merged = {item_id: (kind, hits) for item_id, kind, hits in top}
+        if cached is not MISSING:
+            for item_id, kind, hits in cached[0]:
+                if item_id not in merged or merged[item_id][1] < hits:
+                    merged[item_id] = (kind, hits)
+        ranked = sorted(merged.items(), key=lambda item: -item[1][1])[:self.__popularity.top_n]
+        await self.__shared.set(
+            "popularity", "top", [[item_id, kind, hits] for item_id, (kind, hits) in ranked], 7 * 24 * 3600
+        )
+
+    async def __warm(self, item_id, kind, budget):
+        # -> (calls, bytes) spent on one item
+        if kind == "folder":
+            return await self.__list_folder(item_id), 0
+        info, calls = await self.__resolve(item_id)
+        if info["type"] == "folder":
+            return calls + await self.__list_folder(item_id), 0
+        return calls, await self.__fetch_head(info, budget) if budget > 0 else 0
+
+    async def __cycle(self, top):
+        calls, budget = self.calls, self.budget
+        for item_id, kind, _ in top:
+            if calls <= 0:
+                break
+            if self.__busy():
+                # live requests are waiting on the same lanes, try next cycle
+                self.yielded += 1
+                break
+            try:
+                spent_calls, spent_bytes = await self.__warm(item_id, kind, budget)
+            except CircuitOpen:
+                # drive is struggling, warming can wait for it to recover
+                break
+            except HttpError as err:
+                calls -= 1
+                if err.resp.status == 404:
+                    self.__popularity.forget(item_id)
+                LOGGER.warning(f"Could not warm {kind} {item_id}: {err}")
+                continue
+            calls -= spent_calls
+            budget -= spent_bytes
+            self.warmed += 1
+
+        self.spent_calls += self.calls - calls
+        self.spent_bytes += self.budget - budget
+
+    async def run(self):
+        await self.__restore()
+        while True:
+            started = time()
+            try:
+                # requests are spread over the workers, so any one of them sees
+                # roughly what's hot on the host, every worker still saves its
+                # view for the next restart
+                top = self.__popularity.top()
+                if self.__is_warmer():
+                    await self.__cycle(top)
+                    self.cycles += 1
+                    self.last_cycle = round(time() - started, 3)
+                if top:
+                    await self.__save(top)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                LOGGER.warning(f"Warm-up cycle failed: {err}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            **self.__popularity.stats(),
+            "enabled": self.enabled,
+            "warmer": self.__lock_file is not None,
+            "cycles": self.cycles,
+            "warmed": self.warmed,
+            "drive_calls": self.spent_calls,
+            "bytes": self.spent_bytes,
+            "yielded_to_live": self.yielded,
+            "last_cycle_s": self.last_cycle,
+            "top": [
+                {"id": item_id, "type": kind, "hits": hits}
+                for item_id, kind, hits in self.__popularity.top(10)
+            ],
+        }
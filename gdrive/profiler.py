@@ -0,0 +1,91 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# sampling profiler for a live worker, a thread snapshots every thread's
+# stack (cpu: the event loop and the executor lanes) while a task on the
+# loop snapshots what each pending task is awaiting (async: where requests
+# wait). output is collapsed stacks, ready for flamegraph.pl/speedscope
+
+import sys
+from collections import Counter
+from os.path import basename
+from threading import Event, Thread, enumerate as threads, get_ident
+from time import perf_counter
+
+from .utils import asyncio
+
+# innermost frames of a thread with nothing to do
+IDLE = {("thread.py", "_worker"), ("selectors.py", "select"), ("threading.py", "wait")}
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def await_chain(coro):
+    # outermost to innermost frame of a suspended coroutine/async generator
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class Profiler:
+    def __init__(self, seconds, interval):
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = Counter()
+        self.ticks = 0
+        self.__stop = Event()
+
+    def __sample_threads(self):
+        me = get_ident()
+        while not self.__stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threads()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if (basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(f"thread:{names.get(ident, ident)}")
+                self.samples[";".join(reversed(stack))] += 1
+            self.ticks += 1
+
+    async def __sample_tasks(self):
+        me = asyncio.current_task()
+        while not self.__stop.is_set():
+            await asyncio.sleep(self.interval)
+            for task in asyncio.all_tasks():
+                if task is me or task.done():
+                    continue
+                stack = [f"task:{task.get_name()}"] + [frame_name(f) for f in await_chain(task.get_coro())]
+                self.samples[";".join(stack)] += 1
+
+    async def run(self):
+        sampler = Thread(target=self.__sample_threads, name="profiler", daemon=True)
+        started = perf_counter()
+        sampler.start()
+        tasks = asyncio.ensure_future(self.__sample_tasks())
+        try:
+            await asyncio.sleep(self.seconds)
+        finally:
+            self.__stop.set()
+            await asyncio.gather(tasks, return_exceptions=True)
+            sampler.join(self.interval * 2 + 1)
+        self.seconds = perf_counter() - started
+        return self
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
@@ -0,0 +1,275 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# retries with jittered backoff, hedged duplicates for calls slower than
+# their p95 and a circuit breaker per drive endpoint
+
+import json
+import random
+from collections import deque
+from logging import getLogger
+from time import monotonic
+
+import httplib2
+from aiohttp import ClientError
+from googleapiclient.errors import HttpError
+
+from .config import Var
+from .metrics import RETRIES, HEDGES, CIRCUIT_TRIPS
+from .tracing import span
+from .utils import asyncio
+
+LOGGER = getLogger(__name__)
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRY_REASONS = ["rateLimitExceeded", "userRateLimitExceeded", "backendError", "internalError"]
+
+
+def error_reason(err):
+    # drive's json error body, e.g. {"error": {"errors": [{"reason": "notFound"}]}}
+    if not isinstance(err, HttpError):
+        return None
+    try:
+        content = err.content.decode() if isinstance(err.content, bytes) else err.content
+        return json.loads(content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+
+class CircuitOpen(HttpError):
+    # a 503 like any other drive failure, so callers need no special casing
+    def __init__(self, endpoint, retry_after):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(
+            httplib2.Response({"status": 503, "content-type": "application/json"}),
+            json.dumps({
+                "error": {
+                    "code": 503,
+                    "message": f"Drive {endpoint} is failing, retry in {retry_after}s",
+                    "errors": [{"reason": "circuitOpen"}],
+                }
+            }).encode(),
+        )
+
+
+def is_retryable(err):
+    if isinstance(err, CircuitOpen):
+        return False
+    if isinstance(err, HttpError):
+        return err.resp.status in RETRY_STATUSES or (
+            err.resp.status == 403 and error_reason(err) in RETRY_REASONS
+        )
+    return isinstance(err, (OSError, asyncio.TimeoutError, ClientError, httplib2.HttpLib2Error))
+
+
+def retry_label(err):
+    return str(err.resp.status) if isinstance(err, HttpError) else type(err).__name__
+
+
+def backoff(attempt):
+    # "full jitter", spreads retries of many streams hitting the same outage
+    return random.uniform(0, min(Var.RETRY_MAX_DELAY, Var.RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class LatencyTracker:
+    def __init__(self, window=200, min_samples=20):
+        self.__samples = deque(maxlen=window)
+        self.__min_samples = min_samples
+
+    def observe(self, seconds):
+        self.__samples.append(seconds)
+
+    def p95(self):
+        if len(self.__samples) < self.__min_samples:
+            return None
+        ordered = sorted(self.__samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def hedge_delay(self):
+        # None until we've seen enough calls to know what slow means
+        if not Var.HEDGE_REQUESTS:
+            return None
+        p95 = self.p95()
+        return None if p95 is None else max(p95, Var.HEDGE_MIN_DELAY / 1000)
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_until = 0.0
+        self.trial = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if not self.opened_until:
+            return "closed"
+        return "open" if monotonic() < self.opened_until else "half_open"
+
+    def check(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial):
+            raise CircuitOpen(self.name, round(self.opened_until - monotonic()) if state == "open" else 1)
+        if state == "half_open":
+            # one trial call decides whether drive is back
+            self.trial = True
+            return True
+        return False
+
+    def release(self):
+        # the trial call was cancelled, it proved nothing either way
+        self.trial = False
+
+    def success(self):
+        self.failures = 0
+        self.opened_until = 0.0
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial = False
+        if self.opened_until or self.failures >= Var.BREAKER_THRESHOLD:
+            if self.state != "open":
+                self.trips += 1
+                CIRCUIT_TRIPS.labels(self.name).inc()
+                LOGGER.warning(f"Drive {self.name} keeps failing, failing fast for {Var.BREAKER_COOLDOWN}s")
+            self.opened_until = monotonic() + Var.BREAKER_COOLDOWN
+
+
+class Resilience:
+    def __init__(self):
+        self.__breakers = {}
+        self.__latency = {}
+        self.hedged = 0
+
+    def breaker(self, endpoint):
+        if endpoint not in self.__breakers:
+            self.__breakers[endpoint] = CircuitBreaker(endpoint)
+        return self.__breakers[endpoint]
+
+    def latency(self, endpoint):
+        if endpoint not in self.__latency:
+            self.__latency[endpoint] = LatencyTracker()
+        return self.__latency[endpoint]
+
+    def record(self, endpoint, err, retry=False):
+        # only drive's own trouble counts against the breaker, a 404 is an answer.
+        # a call counts once however often it's retried, so one bad file can't
+        # trip the endpoint for every other caller
+        if err is None or not is_retryable(err):
+            self.breaker(endpoint).success()
+        elif not retry:
+            self.breaker(endpoint).failure()
+
+    async def __race(self, endpoint, start_one):
+        # start_one() -> awaitable, a duplicate is started once the first is
+        # slower than the endpoint's p95 and whichever succeeds first wins
+        delay = self.latency(endpoint).hedge_delay()
+        tasks = [asyncio.ensure_future(start_one())]
+        try:
+            error = None
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=delay if len(tasks) == 1 and error is None else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self.hedged += 1
+                    HEDGES.labels(endpoint).inc()
+                    tasks.append(asyncio.ensure_future(start_one()))
+                    continue
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        return task
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def call(self, endpoint, func, *args, **kwargs):
+        with span(endpoint):
+            return await self.__call(endpoint, func, *args, **kwargs)
+
+    async def __call(self, endpoint, func, *args, **kwargs):
+        breaker = self.breaker(endpoint)
+        attempt = 0
+        while True:
+            trial = breaker.check()
+            started = monotonic()
+            try:
+                task = await self.__race(endpoint, lambda: func(*args, **kwargs))
+            except Exception as err:
+                # the attempt holding the half-open trial always counts, it
+                # has to end the trial one way or the other
+                self.record(endpoint, err, retry=attempt > 0 and not trial)
+                if not is_retryable(err) or attempt >= Var.RETRY_LIMIT:
+                    raise
+                RETRIES.labels(retry_label(err)).inc()
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                if trial:
+                    breaker.release()
+                raise
+            self.record(endpoint, None)
+            self.latency(endpoint).observe(monotonic() - started)
+            return task.result()
+
+    async def open_stream(self, endpoint, opener, retry=False):
+        # opener() -> async generator, returns the one that produced its first
+        # piece soonest together with that piece (None if it was empty)
+        breaker = self.breaker(endpoint)
+        trial = breaker.check()
+        started = monotonic()
+        streams = {}
+
+        async def _first():
+            stream = opener()
+            task = asyncio.current_task()
+            streams[task] = stream
+            try:
+                return await stream.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        winner = None
+        try:
+            with span(endpoint):
+                winner = await self.__race(endpoint, _first)
+        except Exception as err:
+            self.record(endpoint, err, retry and not trial)
+            raise
+        except BaseException:
+            if trial:
+                breaker.release()
+            raise
+        finally:
+            for task, stream in streams.items():
+                if task is not winner:
+                    await stream.aclose()
+        self.record(endpoint, None)
+        self.latency(endpoint).observe(monotonic() - started)
+        return streams[winner], winner.result()
+
+    def stats(self):
+        endpoints = {}
+        for name, breaker in self.__breakers.items():
+            p95 = self.latency(name).p95()
+            endpoints[name] = {
+                "state": breaker.state,
+                "consecutive_failures": breaker.failures,
+                "trips": breaker.trips,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return {"hedged": self.hedged, "endpoints": endpoints}
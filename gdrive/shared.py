@@ -0,0 +1,134 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# sqlite (wal) cache shared by every gunicorn worker on the host, sits under
+# the in-process TTLCaches so a worker's cold miss is usually another's hit
+
+import json
+import sqlite3
+from logging import getLogger
+from threading import Lock
+from time import time
+
+from .cache import MISSING
+from .config import Var
+from .metrics import CACHE_LOOKUPS
+from .utils import run_async, SQLiteConnections
+
+LOGGER = getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    expires REAL NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires ON entries(expires);
+"""
+
+# sweep expired rows and trim to maxsize once every this many writes
+SWEEP_EVERY = 256
+
+
+class SharedCache:
+    def __init__(self, path=Var.SHARED_CACHE_PATH, maxsize=Var.SHARED_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.__conn = SQLiteConnections(path, SCHEMA, timeout=5)
+        self.__writes = 0
+        self.__lock = Lock()
+
+    @property
+    def enabled(self):
+        return Var.SHARED_CACHE and bool(self.path) and self.maxsize > 0
+
+    def __count(self, result):
+        with self.__lock:
+            if result == "hit":
+                self.hits += 1
+            elif result == "miss":
+                self.misses += 1
+            else:
+                self.errors += 1
+        CACHE_LOOKUPS.labels("shared", result).inc()
+
+    @run_async
+    def get(self, ns, key):
+        # returns (value, expires_at) or MISSING, never raises: this tier is
+        # only an optimisation and drive is always the fallback
+        if not self.enabled:
+            return MISSING
+        try:
+            row = self.__conn().execute(
+                "SELECT value, expires FROM entries WHERE ns = ? AND key = ? AND expires > ?",
+                (ns, key, time()),
+            ).fetchone()
+        except sqlite3.Error as err:
+            LOGGER.warning(f"Shared cache read failed: {err}")
+            self.__count("error")
+            return MISSING
+        if row is None:
+            self.__count("miss")
+            return MISSING
+        self.__count("hit")
+        return json.loads(row[0]), row[1]
+
+    @run_async
+    def set(self, ns, key, value, ttl):
+        if not self.enabled or ttl <= 0:
+            return
+        try:
+            with self.__conn() as conn:
+                conn.execute(
+                    "INSERT INTO entries(ns, key, expires, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(ns, key) DO UPDATE SET "
+                    "expires = excluded.expires, value = excluded.value",
+                    (ns, key, time() + ttl, json.dumps(value, separators=(",", ":"))),
+                )
+            with self.__lock:
+                self.__writes += 1
+                sweep = self.__writes % SWEEP_EVERY == 0
+            if sweep:
+                self.__sweep()
+        except sqlite3.Error as err:
+            LOGGER.warning(f"Shared cache write failed: {err}")
+            self.__count("error")
+
+    @run_async
+    def delete(self, ns, key):
+        if not self.enabled:
+            return
+        try:
+            with self.__conn() as conn:
+                conn.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+        except sqlite3.Error as err:
+            LOGGER.warning(f"Shared cache delete failed: {err}")
+
+    def __sweep(self):
+        with self.__conn() as conn:
+            conn.execute("DELETE FROM entries WHERE expires <= ?", (time(),))
+            # over budget, drop whatever would expire soonest
+            conn.execute(
+                "DELETE FROM entries WHERE (ns, key) IN ("
+                "SELECT ns, key FROM entries ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
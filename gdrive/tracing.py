@@ -0,0 +1,150 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+# per request timing spans: whatever runs inside a request (drive calls,
+# executor queueing, rendering) adds to that request's trace through a
+# contextvar, reported as Server-Timing and kept when the request was slow
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter, time
+
+from .config import Var
+
+TRACE = ContextVar("trace", default=None)
+
+
+class Trace:
+    __slots__ = ("method", "path", "status", "at", "started", "ttfb", "duration", "spans", "done")
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.status = None
+        self.at = time()
+        self.started = perf_counter()
+        self.ttfb = None
+        self.duration = None
+        # name -> [seconds, count], spans may overlap (a drive call and the
+        # executor time it ran in) so they don't have to add up to the total
+        self.spans = {}
+        self.done = False
+
+    def add(self, name, seconds):
+        # background tasks inherit the context, ignore them once we've answered
+        if self.done:
+            return
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+    def server_timing(self):
+        entries = [
+            f'{name};dur={seconds * 1000:.1f};desc="x{count}"' if count > 1 else f"{name};dur={seconds * 1000:.1f}"
+            for name, (seconds, count) in self.spans.items()
+        ]
+        entries.append(f"app;dur={(perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "at": round(self.at, 3),
+            "ttfb_ms": round(self.ttfb * 1000, 1) if self.ttfb is not None else None,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "spans": {
+                name: {"ms": round(seconds * 1000, 1), "count": count}
+                for name, (seconds, count) in sorted(self.spans.items(), key=lambda s: -s[1][0])
+            },
+        }
+
+
+def record(name, seconds):
+    trace = TRACE.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def span(name):
+    trace = TRACE.get()
+    if trace is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, perf_counter() - started)
+
+
+class SlowRequests:
+    # ring buffer of recent requests whose first byte took longer than
+    # `threshold`, downloads are judged by ttfb not by how long they stream
+    def __init__(self, size=Var.SLOW_REQUESTS, threshold=Var.SLOW_REQUEST_MS / 1000):
+        self.threshold = threshold
+        self.__traces = deque(maxlen=max(size, 1))
+        self.__lock = Lock()
+        self.seen = 0
+
+    def add(self, trace):
+        self.seen += 1
+        if trace.ttfb is not None and trace.ttfb >= self.threshold:
+            with self.__lock:
+                self.__traces.append(trace)
+
+    def slowest(self, limit=None):
+        with self.__lock:
+            traces = sorted(self.__traces, key=lambda t: -t.ttfb)
+        return [trace.summary() for trace in traces[:limit]]
+
+
+SLOW_REQUESTS = SlowRequests()
+
+
+class TimingMiddleware:
+    # plain asgi so streamed bodies pass straight through, the header only
+    # carries what happened before the response started, the full
+    # breakdown of streamed requests lands in SLOW_REQUESTS
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not Var.SERVER_TIMING:
+            return await self.app(scope, receive, send)
+
+        trace = Trace(scope["method"], scope["path"])
+        token = TRACE.set(trace)
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode()))
+                # lets browser devtools/resource timing read it cross origin
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and trace.ttfb is None:
+                trace.ttfb = perf_counter() - trace.started
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            TRACE.reset(token)
+            trace.duration = perf_counter() - trace.started
+            if trace.ttfb is None:
+                trace.ttfb = trace.duration
+            trace.done = True
+            SLOW_REQUESTS.add(trace)
@@ -0,0 +1,91 @@
+# Google-Drive-Mirror - Mirror/Indexer of Gdrive with FastAPI
+# Copyright (C) 2025 kaif-00z
+#
+# This file is a part of < https://github.com/kaif-00z/Google-Drive-Mirror/ >
+# PLease read the GNU Affero General Public License in
+# <https://github.com/kaif-00z/Google-Drive-Mirror/blob/main/LICENSE>.
+
+from logging import getLogger
+from time import monotonic
+
+import httplib2
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from google_auth_httplib2 import Request as AuthRequest
+from googleapiclient.errors import HttpError
+
+from .config import Var
+from .metrics import DRIVE_LATENCY
+from .utils import run_async, asyncio
+
+LOGGER = getLogger(__name__)
+
+MEDIA_URL = Var.DRIVE_API_URL.rstrip("/") + "/files/{}?alt=media&supportsAllDrives=true"
+
+
+class AsyncMediaTransport:
+    # streams `alt=media` bodies straight into the event loop over pooled
+    # keep-alive connections, no thread hop per chunk
+    def __init__(self, pool_size=Var.HTTP_POOL_SIZE):
+        self.__pool_size = pool_size
+        self.__session = None
+        self.__refresh_lock = None
+
+    def __get_session(self):
+        # must be created inside the worker's running loop, not at import
+        if self.__session is None or self.__session.closed:
+            self.__session = ClientSession(
+                connector=TCPConnector(
+                    limit=self.__pool_size,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60,
+                ),
+                timeout=ClientTimeout(total=None, sock_connect=30, sock_read=60),
+                auto_decompress=False,
+            )
+            self.__refresh_lock = asyncio.Lock()
+        return self.__session
+
+    @run_async
+    def __refresh(self, credentials):
+        credentials.refresh(AuthRequest(httplib2.Http()))
+
+    async def __auth_headers(self, credentials):
+        if credentials is None:
+            return {}
+        if not credentials.valid:
+            async with self.__refresh_lock:
+                if not credentials.valid:
+                    await self.__refresh(credentials)
+        if not credentials.token:
+            return {}
+        return {"Authorization": f"Bearer {credentials.token}"}
+
+    async def stream(self, credentials, file_id, start=0, end=None, read_size=1024 * 1024):
+        session = self.__get_session()
+        url = MEDIA_URL.format(file_id)
+        headers = await self.__auth_headers(credentials)
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        # the bytes go out under a Content-Length and ranges of the real file,
+        # so they must never arrive encoded
+        headers["Accept-Encoding"] = "identity"
+
+        started = monotonic()
+        async with session.get(url, headers=headers) as resp:
+            DRIVE_LATENCY.labels("get_media").observe(monotonic() - started)
+            if resp.status not in [200, 206]:
+                content = await resp.read()
+                # same error type as the googleapiclient path so callers
+                # don't care which backend served them
+                raise HttpError(
+                    httplib2.Response(
+                        {"status": resp.status, **{k.lower(): v for k, v in resp.headers.items()}}
+                    ),
+                    content,
+                    uri=url,
+                )
+            async for data in resp.content.iter_chunked(read_size):
+                yield data
+
+    async def close(self):
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
@@ -7,8 +7,20 @@
 
 import asyncio
 import multiprocessing
+import sqlite3
 from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
 from functools import partial, wraps
+from hashlib import sha1
+from os import getpid
+from threading import Lock, local
+from time import monotonic
+from urllib.parse import quote
+
+from .config import Var
+from .metrics import EXECUTOR_WAIT
+from .tracing import record
 
 def hbs(size):
     if not size:
@@ -21,13 +33,259 @@ def hbs(size):
         raised_to_pow += 1
     return str(round(size, 2)) + " " + dict_power_n[raised_to_pow] + "B"
 
+class _Lane:
+    # one shared pool per kind of blocking work, so long media downloads
+    # can never occupy the threads metadata/listing calls are waiting on
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self.__executor = None
+        self.__pid = None
+        self.__lock = Lock()
+        self.pending = 0
+        self.active = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def executor(self):
+        # created lazily and per process, threads don't survive gunicorn's fork
+        if self.__executor is None or self.__pid != getpid():
+            self.__pid = getpid()
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"{self.name}-lane"
+            )
+        return self.__executor
+
+    def wrap(self, func):
+        queued_at = monotonic()
+        with self.__lock:
+            self.pending += 1
+
+        def _job():
+            waited = _job.waited = monotonic() - queued_at
+            with self.__lock:
+                if not _job.dequeued:
+                    _job.dequeued = True
+                    self.pending -= 1
+                self.active += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            EXECUTOR_WAIT.labels(self.name).observe(waited)
+            try:
+                return func()
+            finally:
+                with self.__lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        _job.waited = 0.0
+        _job.dequeued = False
+        return _job
+
+    def discard(self, job):
+        # cancelled while still queued (hedge loser, client gone), it never runs
+        with self.__lock:
+            if not job.dequeued:
+                job.dequeued = True
+                self.pending -= 1
+
+    def stats(self):
+        with self.__lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.pending,
+                "active": self.active,
+                "completed": self.completed,
+                "avg_wait_ms": round(self.total_wait / started * 1000, 3) if started else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+LANES = {
+    "meta": _Lane("meta", Var.META_WORKERS or multiprocessing.cpu_count() * 5),
+    "media": _Lane("media", Var.MEDIA_WORKERS or multiprocessing.cpu_count() * 5),
+}
+
+
+def executor_stats():
+    return {name: lane.stats() for name, lane in LANES.items()}
+
+
 # thanks to github.com/TeamUltroid/pyUltroid for the below function under AGPLv3 license
-def run_async(function):
-    @wraps(function)
-    async def wrapper(*args, **kwargs):
-        return await asyncio.get_event_loop().run_in_executor(
-            ThreadPoolExecutor(max_workers=multiprocessing.cpu_count() * 5),
-            partial(function, *args, **kwargs),
-        )
-
-    return wrapper
\ No newline at end of file
+def run_async(function=None, *, lane="meta"):
+    def decorator(function):
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            _lane = LANES[lane]
+            job = _lane.wrap(partial(function, *args, **kwargs))
+            started = monotonic()
+            future = asyncio.get_running_loop().run_in_executor(_lane.executor, job)
+            future.add_done_callback(lambda f: f.cancelled() and _lane.discard(job))
+            try:
+                return await future
+            finally:
+                # executor threads don't see the request's context, time it from here
+                record(f"{lane}-queue", job.waited)
+                record(f"{lane}-run", monotonic() - started - job.waited)
+
+        return wrapper
+
+    return decorator(function) if function else decorator
+
+
+class SQLiteConnections:
+    # sqlite connections can't hop threads, keep one per executor thread, wal
+    # so readers in other workers never wait on the writer
+    def __init__(self, path, schema, timeout):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self.__local = local()
+
+    def __call__(self):
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self.__local.conn = conn
+        return conn
+
+class ChunkSizer:
+    # upstream chunk sizes for one stream: small at first so the first byte
+    # leaves quickly, then doubling but never past what the client drains
+    # in DRAIN_WINDOW seconds, since anything bigger just sits in memory
+    DRAIN_WINDOW = 1.0
+
+    def __init__(self, maximum, first=Var.FIRST_CHUNK_SIZE * 1024):
+        self.maximum = maximum
+        self.__size = min(first, maximum) if Var.ADAPTIVE_CHUNKS else maximum
+        self.__floor = self.__size
+        self.__drained = 0
+        self.__since = None
+
+    def drained(self, nbytes):
+        # the clock starts once the first piece is gone, not at request time
+        if self.__since is None:
+            self.__since = monotonic()
+            return
+        self.__drained += nbytes
+
+    def rate(self):
+        elapsed = monotonic() - self.__since if self.__since else 0
+        return self.__drained / elapsed if elapsed > 0 else 0
+
+    def take(self, remaining=None):
+        size = self.__size if remaining is None else min(self.__size, remaining)
+        if Var.ADAPTIVE_CHUNKS:
+            grown = self.__size * 2
+            rate = self.rate()
+            if rate:
+                grown = min(grown, max(int(rate * self.DRAIN_WINDOW), self.__floor))
+            self.__size = min(grown, self.maximum)
+        return size
+
+
+def parse_range(range_header, size, max_ranges=16):
+    # returns [] when header should be ignored (serve full body),
+    # None when it's unsatisfiable and a list of (start, end) otherwise
+    if not range_header or not range_header.startswith("bytes="):
+        return []
+    ranges = []
+    for spec in range_header[6:].split(","):
+        spec = spec.strip()
+        if "-" not in spec:
+            return []
+        start, end = spec.split("-", 1)
+        if not (start or end) or not all(part.isdigit() for part in (start, end) if part):
+            return []
+        if not start:
+            # suffix range, last N bytes
+            length = int(end)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            if end and int(start) > int(end):
+                # invalid rather than unsatisfiable (rfc 9110 14.1.2), ignore the header
+                return []
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            continue
+        ranges.append((start, end))
+    if not ranges:
+        return None
+    if len(ranges) > max_ranges:
+        return []
+    # coalesce overlapping / adjacent ranges so we never fetch a byte twice
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def content_version(info):
+    # what cached chunks of a file are keyed on, changes with its content
+    return info.get("md5_checksum") or info.get("modified_time")
+
+
+def is_media(mime_type):
+    return bool(mime_type) and mime_type.startswith(("video/", "audio/"))
+
+
+def file_etag(info):
+    if info.get("md5_checksum"):
+        return f'"{info["md5_checksum"]}"'
+    if info.get("modified_time"):
+        return f'W/"{info["id"]}-{info["modified_time"]}"'
+    return None
+
+
+def content_disposition(filename, disposition="attachment"):
+    # headers are latin-1, so an ascii fallback plus the real name as
+    # filename* (rfc 6266/5987) for clients that understand it
+    fallback = "".join(
+        c if " " <= c <= "~" and c not in '"\\' else "_" for c in filename
+    )
+    if fallback == filename:
+        return f'{disposition}; filename="{filename}"'
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def http_date(rfc3339):
+    if not rfc3339:
+        return None
+    return format_datetime(
+        datetime.fromisoformat(rfc3339.replace("Z", "+00:00")), usegmt=True
+    )
+
+
+def weak_etag(*parts):
+    # for json views, the body changes whenever one of the parts does
+    digest = sha1("\x00".join(str(p) for p in parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def not_modified(headers, etag, last_modified):
+    # If-None-Match wins over If-Modified-Since (rfc 9110 13.2.2), weak compare
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match:
+        if not etag:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = headers.get("If-Modified-Since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -8,17 +8,39 @@
 # if you are using this following code then don't forgot to give proper
 # credit to t.me/kAiF_00z (github.com/kaif-00z)
 
+import asyncio
 import logging
 import mimetypes
+from contextlib import asynccontextmanager, aclosing
+from time import monotonic
 from traceback import format_exc
+from uuid import uuid4
 
+import orjson
 from fastapi import FastAPI, Request, Response
 from fastapi import HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.openapi.docs import get_swagger_ui_html
 
 from gdrive import GoogleDriver
+from gdrive.accounts import AllAccountsExhausted
+from gdrive.config import Var
+from gdrive.utils import (
+    parse_range,
+    file_etag,
+    http_date,
+    weak_etag,
+    not_modified,
+    content_version,
+    is_media,
+    executor_stats,
+    content_disposition,
+)
+from gdrive.metrics import render_metrics, DL_TTFB, DL_BYTES
+from gdrive.profiler import Profiler
+from gdrive.resilience import CircuitOpen
+from gdrive.tracing import SLOW_REQUESTS, TimingMiddleware, span
 from models import SearchResponse, FileFolderResponse, FilesFoldersListResponse,  Optional
 from models import FileNotFound
 
@@ -34,14 +56,24 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+client = GoogleDriver()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client.start()
+    yield
+    await client.close()
+
+
 app = FastAPI(
     title="Google Drive Mirror",
     summary="High Speed Gdrive Mirror, Indexer & File Streamer Written Asynchronous in Python with FastAPI With Awsome Features & Stablility.",
     version="v0.0.1@beta.1ps",
     docs_url=None,
     redoc_url=None,
+    lifespan=lifespan,
 )
-client = GoogleDriver()
 
 app.add_middleware(
     CORSMiddleware,
@@ -50,6 +82,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# outermost, so its clock starts before anything else touches the request
+app.add_middleware(TimingMiddleware)
 
 @app.get("/", include_in_schema=False)
 async def overridden_swagger():
@@ -59,6 +93,82 @@ async def overridden_swagger():
         swagger_favicon_url="https://ssl.gstatic.com/docs/doclist/images/drive_2022q3_32dp.png",
     )
 
+@app.get("/stats", include_in_schema=False)
+async def stats():
+    return JSONResponse(
+        {
+            "success": True,
+            "executors": executor_stats(),
+            "caches": client.cache_stats(),
+            "accounts": client.account_stats(),
+            "drive": client.drive_stats(),
+            "warmup": client.warmup_stats(),
+        }
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/debug/slow", include_in_schema=False)
+async def slow_requests(limit: int = Query(20, ge=1, le=1000)):
+    return JSONResponse(
+        {
+            "success": True,
+            "threshold_ms": Var.SLOW_REQUEST_MS,
+            "seen": SLOW_REQUESTS.seen,
+            "data": SLOW_REQUESTS.slowest(limit),
+        }
+    )
+
+profiling = asyncio.Lock()
+
+@app.get("/debug/profile", include_in_schema=False)
+async def profile(
+    seconds: float = Query(10, gt=0, description="How long to sample this worker for"),
+    interval: float = Query(10, ge=1, le=1000, description="Milli seconds between samples"),
+):
+    # off by default, it's a live look into whichever worker takes the request
+    if not Var.DEBUG_PROFILE:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if profiling.locked():
+        return PlainTextResponse("A profile is already running in this worker", status_code=status.HTTP_409_CONFLICT)
+    async with profiling:
+        result = await Profiler(min(seconds, Var.PROFILE_MAX_SECONDS), interval / 1000).run()
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={"X-Profile-Seconds": f"{result.seconds:.2f}", "X-Profile-Ticks": str(result.ticks)},
+    )
+
+@app.get("/dl/folder/{folder_id}", include_in_schema=False)
+async def folder_zip_handler(folder_id: str):
+    try:
+        folder_info = await client.get_file_info(folder_id)
+    except (CircuitOpen, AllAccountsExhausted) as e:
+        return Response(
+            content="Drive is temporarily unavailable, retry shortly",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(max(e.retry_after, 1))},
+        )
+    except Exception as e:
+        log.warning(f"Folder not found: {folder_id}, reason: {str(e)}")
+        return Response(content="Folder not found", status_code=status.HTTP_404_NOT_FOUND)
+
+    if folder_info.get("type") != "folder":
+        return Response(content="Not a folder, use /dl/{file_id}", status_code=status.HTTP_400_BAD_REQUEST)
+    client.record_access(folder_id, "folder")
+
+    # sizes aren't known up front (data descriptors), so no Content-Length
+    # and no ranges, the first bytes go out as soon as the first file starts
+    return StreamingResponse(
+        status_code=200,
+        content=metered(client.zip_folder(folder_id), monotonic()),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(f'{folder_info.get("name")}.zip')},
+    )
+
+
 @app.get("/dl/{file_id}", include_in_schema=False)
 async def stream_handler(request: Request, file_id: str) -> StreamingResponse:
     try:
@@ -78,6 +188,13 @@ async def stream_handler(request: Request, file_id: str) -> StreamingResponse:
             content=f"File not found: {getattr(e, 'reason', 'File does not exist')}",
             status_code=status.HTTP_404_NOT_FOUND
         )
+    except (CircuitOpen, AllAccountsExhausted) as e:
+        log.warning(f"Drive unavailable for {file_id}: {getattr(e, 'reason', str(e))}")
+        return Response(
+            content="Drive is temporarily unavailable, retry shortly",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(max(e.retry_after, 1))},
+        )
     except ConnectionResetError:
         log.info(f"Client disconnected during stream: {file_id}")
         return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -100,7 +217,41 @@ async def stream_handler(request: Request, file_id: str) -> StreamingResponse:
         )
 
 
+async def metered(stream, started):
+    first_byte = True
+    async with aclosing(stream):
+        async for chunk in stream:
+            if first_byte:
+                DL_TTFB.observe(monotonic() - started)
+                first_byte = False
+            DL_BYTES.inc(len(chunk))
+            yield chunk
+
+
+def exhausted(error):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={
+            "success": False,
+            "error": str(error),
+        },
+        headers={"Retry-After": str(max(error.retry_after, 1))},
+    )
+
+
+def cache_headers(etag, last_modified, cache_control):
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return headers
+
+
 async def media_streamer(request: Request, file_id: str):
+    started = monotonic()
     range_header = request.headers.get("Range", 0)
     log.info(
         f"now serving {request.headers.get('X-FORWARDED-FOR')}"
@@ -108,64 +259,141 @@ async def media_streamer(request: Request, file_id: str):
 
     try:
         file_info = await client.get_file_info(file_id)
+    except (CircuitOpen, AllAccountsExhausted):
+        raise
     except Exception as error:
         raise FileNotFound(error)
+    client.record_access(file_id, "file")
 
     file_size = file_info.get("size")
+    etag = file_etag(file_info)
+    version = content_version(file_info)
+    last_modified = http_date(file_info.get("modified_time"))
+    validators = cache_headers(etag, last_modified, Var.DL_CACHE_CONTROL)
+
+    if not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=validators)
 
-    if range_header:
-        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
-        from_bytes = int(from_bytes)
-        until_bytes = int(until_bytes) if until_bytes else file_size - 1
-    else:
-        from_bytes = 0
-        until_bytes = file_size - 1
+    # If-Range: only honour the range when the client's copy is still current
+    if_range = request.headers.get("If-Range")
+    if range_header and if_range:
+        if if_range.startswith("W/") or if_range not in [etag, last_modified]:
+            range_header = 0
 
-    if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
+    ranges = parse_range(range_header, file_size)
+    if ranges is None:
         return Response(
             status_code=416,
             content="416: Range not satisfiable",
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    until_bytes = min(until_bytes, file_size - 1)
-    req_length = until_bytes - from_bytes + 1
+    client.check_download(file_id)
+    client.prefetch_media(file_info)
 
-    mime_type = file_info.get("mimeType")
+    mime_type = file_info.get("mime_type")
     file_name = file_info.get("name")
     disposition = "attachment"
 
     if not mime_type:
         mime_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
 
+    headers = {
+        "Content-Disposition": content_disposition(file_name, disposition),
+        "Accept-Ranges": "bytes",
+        **validators,
+    }
+
+    if not ranges:
+        headers["Content-Type"] = mime_type
+        headers["Content-Length"] = str(file_size)
+        return StreamingResponse(
+            status_code=200,
+            content=metered(
+                client.stream_file(file_id, 0, file_size - 1, version=version, size=file_size),
+                started,
+            ),
+            headers=headers,
+        )
+
+    if len(ranges) == 1:
+        from_bytes, until_bytes = ranges[0]
+        headers["Content-Type"] = mime_type
+        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+        headers["Content-Length"] = str(until_bytes - from_bytes + 1)
+        return StreamingResponse(
+            status_code=206,
+            content=metered(
+                client.stream_file(
+                    file_id, from_bytes, until_bytes, version=version, size=file_size,
+                    read_ahead=is_media(mime_type),
+                ),
+                started,
+            ),
+            headers=headers,
+        )
+
+    boundary = uuid4().hex
+    parts = [
+        (
+            from_bytes,
+            until_bytes,
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {mime_type}\r\n"
+                f"Content-Range: bytes {from_bytes}-{until_bytes}/{file_size}\r\n\r\n"
+            ).encode(),
+        )
+        for from_bytes, until_bytes in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+
+    async def multipart_body():
+        for from_bytes, until_bytes, part_header in parts:
+            yield part_header
+            async with aclosing(
+                client.stream_file(file_id, from_bytes, until_bytes, version=version, size=file_size)
+            ) as stream:
+                async for chunk in stream:
+                    yield chunk
+        yield closing
+
+    headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    headers["Content-Length"] = str(
+        sum(len(h) + e - s + 1 for s, e, h in parts) + len(closing)
+    )
     return StreamingResponse(
-        status_code=206 if range_header else 200,
-        content=client._stream_file(file_id),
-        headers={
-            "Content-Type": f"{mime_type}",
-            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-            "Content-Length": str(req_length),
-            "Content-Disposition": f'{disposition}; filename="{file_name}"',
-            "Accept-Ranges": "bytes",
-        },
+        status_code=206,
+        content=metered(multipart_body(), started),
+        headers=headers,
     )
 
 
 @app.get("/info", response_model=FileFolderResponse)
 async def file_info(
+    request: Request,
     file_id: str = Query(..., description="Google Drive file or folder ID")
 ):
     try:
         data = await client.get_file_info(file_id)
-        return JSONResponse(
-            {
-                "success": True,
-                "data": data,
-            }
-        )
+        client.record_access(data["id"], data["type"])
+        etag = weak_etag(data["id"], data.get("version"), data.get("modified_time"), data.get("md5_checksum"))
+        headers = cache_headers(etag, http_date(data.get("modified_time")), Var.INFO_CACHE_CONTROL)
+        if not_modified(request.headers, etag, headers.get("Last-Modified")):
+            return Response(status_code=304, headers=headers)
+        with span("render"):
+            return JSONResponse(
+                {
+                    "success": True,
+                    "data": data,
+                },
+                headers=headers,
+            )
+    except (CircuitOpen, AllAccountsExhausted) as e:
+        raise exhausted(e)
     except Exception as e:
         raise HTTPException(
-            status_code=getattr(e.resp, 'status', status.HTTP_500_INTERNAL_SERVER_ERROR),
+            status_code=getattr(getattr(e, 'resp', None), 'status', status.HTTP_500_INTERNAL_SERVER_ERROR),
             detail={
                 "success": False,
                 "error": getattr(e, 'reason', str(e)),
@@ -175,6 +403,7 @@ async def file_info(
 
 @app.get("/folders/list", response_model=FilesFoldersListResponse)
 async def folders_in_root(
+    request: Request,
     folder_id: Optional[str] = Query(None, description="Google Drive folder ID (optional, defaults to root)"),
     page_size: int = Query(100, ge=1, le=100, description="Number of items per page"),
     page_token: Optional[str] = Query(None, description="Pagination token for next page")
@@ -184,16 +413,31 @@ async def folders_in_root(
             await client.list_all(page_token=page_token, page_size=page_size) if not folder_id 
             else await client.list_all(folder_id=folder_id, page_token=page_token, page_size=page_size)
         )
-        return JSONResponse(
-            {
-                "success": True,
-                "data": data,
-                "additional_info": info
-            }
+        if not page_token:
+            client.record_access(folder_id or Var.ROOT_FOLDER_ID, "folder")
+        # a folder's own modifiedTime doesn't move when children are removed,
+        # so the page is validated by what's in it and there's no Last-Modified
+        etag = weak_etag(
+            info["page_token"],
+            *(f"{item['id']}:{item['name']}:{item['modified_time']}" for item in data),
         )
+        headers = cache_headers(etag, None, Var.LIST_CACHE_CONTROL)
+        if not_modified(request.headers, etag, None):
+            return Response(status_code=304, headers=headers)
+        with span("render"):
+            return JSONResponse(
+                {
+                    "success": True,
+                    "data": data,
+                    "additional_info": info
+                },
+                headers=headers,
+            )
+    except (CircuitOpen, AllAccountsExhausted) as e:
+        raise exhausted(e)
     except BaseException as e:
         raise HTTPException(
-            status_code=getattr(e, 'status', status.HTTP_500_INTERNAL_SERVER_ERROR),
+            status_code=getattr(getattr(e, 'resp', None), 'status', status.HTTP_500_INTERNAL_SERVER_ERROR),
             detail={
                 "success": False,
                 "error": getattr(e, 'reason', str(e)),
@@ -201,6 +445,33 @@ async def folders_in_root(
         )
 
 
+async def ndjson(pages):
+    totals = {"total_files": 0, "total_folders": 0, "total_files_size": 0}
+    try:
+        async with aclosing(pages):
+            async for items, info in pages:
+                if items:
+                    yield b"\n".join(orjson.dumps(item) for item in items) + b"\n"
+                for key in totals:
+                    totals[key] += info[key]
+        yield orjson.dumps({"success": True, "additional_info": totals}) + b"\n"
+    except Exception as e:
+        # headers are long gone, so the error becomes the last record
+        log.error(f"Error while streaming listing: {e}")
+        yield orjson.dumps({"success": False, "error": getattr(e, 'reason', str(e))}) + b"\n"
+
+
+@app.get("/folders/stream")
+async def folders_stream(
+    folder_id: Optional[str] = Query(None, description="Google Drive folder ID (optional, defaults to root)")
+):
+    client.record_access(folder_id or Var.ROOT_FOLDER_ID, "folder")
+    return StreamingResponse(
+        ndjson(client.iter_folder(folder_id) if folder_id else client.iter_folder()),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.get("/search", response_model=SearchResponse)
 async def search(
     query: str = Query(..., min_length=3, description="Search query"),
@@ -209,18 +480,31 @@ async def search(
 ):
     try:
         data, info = await client.search_files_in_drive(query, page_token=page_token, page_size=page_size)
-        return JSONResponse(
-            {
-                "success": True,
-                "data": data,
-                "additional_info": info
-            }
-        )
+        with span("render"):
+            return JSONResponse(
+                {
+                    "success": True,
+                    "data": data,
+                    "additional_info": info
+                }
+            )
+    except (CircuitOpen, AllAccountsExhausted) as e:
+        raise exhausted(e)
     except BaseException as e:
         raise HTTPException(
-            status_code=getattr(e.resp, 'status', status.HTTP_500_INTERNAL_SERVER_ERROR),
+            status_code=getattr(getattr(e, 'resp', None), 'status', status.HTTP_500_INTERNAL_SERVER_ERROR),
             detail={
                 "success": False,
                 "error": getattr(e, 'reason', str(e)),
             }
-        )
\ No newline at end of file
+        )
+
+
+@app.get("/search/stream")
+async def search_stream(
+    query: str = Query(..., min_length=3, description="Search query")
+):
+    return StreamingResponse(
+        ndjson(client.iter_search(query)),
+        media_type="application/x-ndjson",
+    )
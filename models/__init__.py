@@ -23,10 +23,14 @@ class BaseFileFolder(BaseModel):
     parent_folder_id: Optional[str] = Field(None, description="Parent folder ID")
 
 class FileFoldersListData(BaseFileFolder):
-    pass
+    bytes: Optional[int] = Field(None, ge=0, description="Size in bytes")
+    md5_checksum: Optional[str] = Field(None, description="MD5 checksum of the content")
+    modified_time: Optional[str] = Field(None, description="Last modification time (RFC 3339)")
 
 class FileFolderData(BaseFileFolder):
-    pass
+    md5_checksum: Optional[str] = Field(None, description="MD5 checksum of the content")
+    modified_time: Optional[str] = Field(None, description="Last modification time (RFC 3339)")
+    version: Optional[str] = Field(None, description="Drive's monotonic version of the item")
 
 class SearchData(BaseFileFolder):
     pass
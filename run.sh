@@ -5,6 +5,10 @@ if [ -f .env ]; then
     export $(grep -v '^#' .env | xargs)
 fi
 
+# shared dir so /metrics adds up every worker, wiped on each start
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/gmirror-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # runner
 gunicorn main:app -k uvicorn.workers.UvicornWorker \
     --bind ${HOST:-0.0.0.0}:${PORT:-5000} \